@@ -3,14 +3,14 @@
     and the AgentView objects which captures the available information
     given to an agent to make each decision.
 """
-from numpy.lib.function_base import average
 from State import AgentView, int_state, int_action_space, int_to_action
 from Cards import Deck, Hand, Card
 from Cards import all_sets, compute_playable
 from q_learn import QLearning
-from param import ParamModel
+from param import ParamModel, run_steps
 import random
 from collections import Counter
+from functools import partial
 
 zeros = []
 
@@ -97,15 +97,11 @@ class DataCollectingAgent(Agent):
         else:
             r = self.backprop_reward(placement)
 
-        discount = 1
         for i in range(len(self.round_data) - 2, -1, -1):
             s, a = self.round_data[i]
-
             sp = self.round_data[i + 1][0]
-
-            r = self.reward(placement) / 100
-            if i == len(self.round_data) - 2:
-                r = self.reward(placement)
+            self.data.append((s, a, r, sp))
+        self.round_data = []
 
     def zero_one_reward(self, placement):
         """
@@ -133,12 +129,17 @@ class ParamAgent(DataCollectingAgent):
             This agent is meant for data collection during
             game simulations.
         """
-    def __init__(self):
+    def __init__(self, batch_size=None):
+        """
+            With batch_size set, the model is trained in mini-batches of batch_size rows (see ParamModel.use_batch_training).
+        """
         self.reward_function = 2 # relative reward
         self.data = []
         self.round_data = []
         self.gamma = 0.95
         self.param_model = ParamModel()
+        if batch_size:
+            self.param_model.use_batch_training(batch_size)
 
     def action_function(self, view):
         return self.param_model.get_action(view)
@@ -147,13 +148,20 @@ class ParamAgent(DataCollectingAgent):
         """
             Same as Agent's get_action, but accumulates data
         """
+        return run_steps(self.action_steps(view))
+
+    def action_steps(self, view):
+        """
+            Chooses the action as a generator, which yields the model's scoring as a request to be
+            batched with other tables' (see MultiTableRunner.py) and returns the action.
+            get_action runs it on its own.
+        """
         if self.auto_passer(view.top_cards, view.hand):
             return "Pass" # pass turn if no playable cards
 
-        action = self.action_function(view)
+        action = yield from self.param_model.get_action_steps(view)
 
-        datum = (int_state(view), action) # store data for the future
-        self.round_data.append(self.param_model.X(view, action))
+        self.round_data.append(self.param_model.features(view, action)) # store data for the future
 
         if isinstance(action, int):
             action = int_to_action(action, view)
@@ -172,8 +180,8 @@ class ParamAgent(DataCollectingAgent):
 
         r = 0 if placement >= 4 else 1
 
-        for X in self.round_data:
-            self.param_model.learn(X, r)
+        self.param_model.learn_round(self.round_data, r)
+        self.round_data = []
 
 
 class QAgent(DataCollectingAgent):
@@ -185,7 +193,7 @@ class QAgent(DataCollectingAgent):
         2. "Pass"
         Any other input will be interpreted as a pass.
     """
-    def __init__(self, file):
+    def __init__(self, file=None):
         print("Initializing QAgent...")
         self.action_function = q_learn_action
         self.learner = QLearning()
@@ -197,9 +205,17 @@ class QAgent(DataCollectingAgent):
             Same as Agent's get_action, but handles extra
             parameter for q_learn_action.
         """
+        return run_steps(self.action_steps(view))
+
+    def action_steps(self, view):
+        """
+            Chooses the action as a generator, which yields the Q lookup as a request to be
+            batched with other tables' (see MultiTableRunner.py) and returns the action.
+            get_action runs it on its own.
+        """
         if self.auto_passer(view.top_cards, view.hand):
             return "Pass" # pass turn if no playable cards
-        action = self.action_function(view, self.learner)
+        action = yield from q_learn_action_steps(view, self.learner)
 
         datum = (int_state(view), action) # store data for the future
         self.round_data.append(datum)
@@ -248,10 +264,10 @@ def random_action(view):
     return random.choice(int_action_space(view))
 
 def getter(f):
-    return lambda : Agent(f)
+    return partial(Agent, f) # a partial instead of a lambda so it can be sent to worker processes
 
 def data_getter(f):
-    return lambda : DataCollectingAgent(f)
+    return partial(DataCollectingAgent, f)
 
 def baseline_action(view):
     """
@@ -288,7 +304,10 @@ def heuristic_action(view):
 
     r = actions[1] + 1
     score = 0
-    for card_rank in {card.rank() for card in view.hand.cards}: # for each unique rank in hand
+    counts = view.hand.rank_counts
+    for card_rank in range(2, 15): # for each unique rank in hand
+        if not counts[card_rank - 2]:
+            continue
         if card_rank < r:
             score -= 1
         elif card_rank > r:
@@ -302,14 +321,17 @@ def q_learn_action(view, learner):
     """
         When the number of cards is greater than 4, uses
         baseline action.
-        Otherwise, it calls optimal_policy() to select
-        the action that maximizes Q for the current state.
+        Otherwise, it selects the action that maximizes Q
+        for the current state, with q_learn_action_steps.
     """
-    if len(view.hand.cards) >= 5:
-        return baseline_action(view)
+    return run_steps(q_learn_action_steps(view, learner))
 
-    s = int_state(view)
-    actions = int_action_space(view)
-    a = learner.optimal_policy(s, actions)
+def q_learn_action_steps(view, learner):
+    """
+        q_learn_action as a generator, which yields its Q lookup
+        as the request (learner.optimal_policy_many, (state, actions)) and is sent back the action.
+    """
+    if len(view.hand) >= 5:
+        return baseline_action(view)
 
-    return a
\ No newline at end of file
+    return (yield (learner.optimal_policy_many, (int_state(view), int_action_space(view))))
@@ -0,0 +1,281 @@
+"""
+    This file implements a batched simulation of Scum that plays many tables at once.
+
+    Every table is stored as rows of NumPy arrays instead of GameState / Hand objects:
+    hands are (tables x players x 13) rank-count matrices, and the top cards, passes and
+    outs are per-table vectors. All tables are advanced one turn at a time in lockstep.
+
+    The rules are the same as in ScumController: dealing starts at the president, the scum
+    and president (and 2nd / 2nd to last, 3rd / 3rd to last) trade with default_trade, and
+    a trick goes once around the table before the last player to play leads again.
+    Suits never matter to the rules, so only ranks are tracked.
+
+    Agents are replaced by batch policies. A batch policy takes a BatchView of the tables
+    where its seat has to act and returns one int action per table, in the same action space
+    as State.int_action_space (0 is a pass, a is playing rank a + 1).
+"""
+import numpy as np
+from collections import Counter
+from Cards import TRADES
+
+N_RANKS = 13
+N_ACTIONS = 14
+MAX_ITER = 1000
+
+
+class BatchView:
+    def __init__(self, hands, top_rank, top_count, legal, seen=None):
+        """
+            The views of k players on k different tables.
+            hands is a (k x 13) rank-count matrix (column 0 is the 2s),
+            top_rank is the rank index of the top cards (-1 if there are none),
+            top_count is the number of top cards,
+            legal is a (k x 14) boolean matrix of the legal int actions and
+            seen is the (k x 13) rank-count matrix of the cards played this round, as SeenCards.rank_counts.
+        """
+        self.hands = hands
+        self.top_rank = top_rank
+        self.top_count = top_count
+        self.legal = legal
+        self.seen = seen
+
+    def unseen(self):
+        """
+            The (k x 13) counts of the cards of every rank still held by the other players.
+        """
+        return 4 - self.seen - self.hands
+
+
+def legal_actions(hands, top_rank, top_count):
+    """
+        Computes the (k x 14) legal action mask of k hands, matching int_action_space.
+    """
+    legal = np.zeros((len(hands), N_ACTIONS), dtype=bool)
+    legal[:, 0] = True # passing is always allowed
+    above = np.arange(N_RANKS)[None, :] > top_rank[:, None] # top_rank is -1 on an empty table, so every rank is above it
+    legal[:, 1:] = (hands >= np.maximum(top_count, 1)[:, None]) & above
+    return legal
+
+
+def baseline_policy(view, rng):
+    """
+        Batched baseline_action: play the lowest legal rank.
+    """
+    plays = view.legal[:, 1:]
+    return np.where(plays.any(axis=1), plays.argmax(axis=1) + 1, 0)
+
+
+def random_policy(view, rng):
+    """
+        Batched random_action: choose uniformly from the legal actions (including a pass).
+    """
+    n_legal = view.legal.sum(axis=1)
+    pick = (rng.random(len(n_legal)) * n_legal).astype(np.int64) # the pick-th legal action
+    cum = np.cumsum(view.legal, axis=1)
+    return (cum <= pick[:, None]).sum(axis=1)
+
+
+def randomized_baseline_policy(view, rng):
+    """
+        Batched randomized_baseline_action: half random, half baseline.
+    """
+    use_random = rng.random(len(view.legal)) <= .5
+    return np.where(use_random, random_policy(view, rng), baseline_policy(view, rng))
+
+
+def heuristic_policy(view, rng):
+    """
+        Batched heuristic_action: lead the lowest rank, and only play on top cards
+        if at least as many distinct ranks in hand are above the lowest playable rank as below it.
+    """
+    actions = baseline_policy(view, rng)
+    low = actions - 1
+    ranks = np.arange(N_RANKS)[None, :]
+    held = view.hands > 0
+    score = (held & (ranks > low[:, None])).sum(axis=1) - (held & (ranks < low[:, None])).sum(axis=1)
+    keep = (view.top_rank < 0) | (score >= 0)
+    return np.where(keep, actions, 0)
+
+
+class BatchScumController:
+    def __init__(self, policies, n_tables, seed=None):
+        """
+            Initialize n_tables tables of Scum, with policies[i] playing seat i at every table.
+        """
+        self.n = len(policies)
+        self.policies = policies
+        self.n_tables = n_tables
+        self.rng = np.random.default_rng(seed)
+        self.tables = np.arange(n_tables)
+
+        self.hands = np.zeros((n_tables, self.n, N_RANKS), dtype=np.int8)
+        self.sizes = np.zeros((n_tables, self.n), dtype=np.int8)
+        self.top_rank = np.full(n_tables, -1, dtype=np.int8)
+        self.top_count = np.zeros(n_tables, dtype=np.int8)
+        self.seen = np.zeros((n_tables, N_RANKS), dtype=np.int8) # cards of each rank played this round
+        self.passed = np.zeros((n_tables, self.n), dtype=bool)
+        self.out = np.zeros((n_tables, self.n), dtype=bool)
+        self.out_order = np.zeros((n_tables, self.n), dtype=np.int64) # order of going out, the same as GameState.out
+        self.n_out = np.zeros(n_tables, dtype=np.int64)
+        self.curr_player = np.zeros(n_tables, dtype=np.int64)
+        self.last_player = np.zeros(n_tables, dtype=np.int64)
+        self.done = np.zeros(n_tables, dtype=bool)
+
+    def deal_round(self, president):
+        """
+            Shuffles a deck for every table and deals it out starting at each table's president.
+        """
+        decks = np.argsort(self.rng.random((self.n_tables, 52)), axis=1)
+        seats = (np.arange(52)[None, :] + president[:, None]) % self.n
+        flat = (self.tables[:, None] * self.n + seats) * N_RANKS + (decks >> 2)
+        counts = np.bincount(flat.ravel(), minlength=self.n_tables * self.n * N_RANKS)
+        self.hands[:] = counts.reshape(self.n_tables, self.n, N_RANKS)
+
+    def trade(self, prev_order):
+        """
+            Applies default_trade between the mirrored positions of prev_order on every table.
+        """
+        t = self.tables
+        for pos, n_trades in TRADES:
+            president = prev_order[:, pos]
+            scum = prev_order[:, -1 - pos]
+            for _ in range(n_trades):
+                # scum gives their highest card
+                give = N_RANKS - 1 - (self.hands[t, scum, ::-1] > 0).argmax(axis=1)
+                self.hands[t, scum, give] -= 1
+                self.hands[t, president, give] += 1
+
+                # president gives away the lowest unpaired card, or the lowest card if everything is paired
+                pres_hand = self.hands[t, president]
+                unpaired = pres_hand == 1
+                give = np.where(unpaired.any(axis=1), unpaired.argmax(axis=1), (pres_hand > 0).argmax(axis=1))
+                self.hands[t, president, give] -= 1
+                self.hands[t, scum, give] += 1
+
+    def setup_round(self, prev_order=None):
+        """
+            Resets every table, deals, and trades if there is a previous order.
+            prev_order is a (tables x players) matrix of the previous round's out order.
+        """
+        self.top_rank[:] = -1
+        self.top_count[:] = 0
+        self.seen[:] = 0
+        self.passed[:] = False
+        self.out[:] = False
+        self.n_out[:] = 0
+        self.last_player[:] = 0
+        self.done[:] = False
+
+        if prev_order is None:
+            president = self.rng.integers(self.n, size=self.n_tables)
+        else:
+            president = prev_order[:, 0]
+        self.curr_player[:] = president
+
+        self.deal_round(president)
+        if prev_order is not None:
+            self.trade(prev_order)
+        self.sizes[:] = self.hands.sum(axis=2)
+
+    def games(self, n_games, n_rounds):
+        """
+            Simulates n_games games of n_rounds rounds at every table.
+            Returns the same list of placement Counters as ScumController.games, summed over all tables.
+        """
+        placements = np.zeros((self.n, self.n), dtype=np.int64) # placements[player, place]
+        scores = None
+        for g in range(n_games):
+            for r in range(n_rounds):
+                scores = self.round(scores)
+                places = np.empty_like(scores)
+                places[self.tables[:, None], scores] = np.arange(self.n)[None, :]
+                for i in range(self.n):
+                    placements[i] += np.bincount(places[:, i], minlength=self.n)
+
+        return [Counter({p : int(cnt) for p, cnt in enumerate(placements[i]) if cnt}) for i in range(self.n)]
+
+    def round(self, prev_order):
+        """
+            Plays one round at every table and returns the (tables x players) out order.
+        """
+        self.setup_round(prev_order)
+        for _ in range(MAX_ITER):
+            active = np.flatnonzero(~self.done)
+            if len(active) == 0:
+                return self.out_order.copy()
+            self.turn(active)
+        raise ValueError("Max Iter reached")
+
+    def turn(self, t):
+        """
+            Runs a single turn for the current player of every table in t.
+        """
+        p = self.curr_player[t]
+        hands = self.hands[t, p]
+        top_rank = self.top_rank[t]
+        top_count = self.top_count[t]
+        legal = legal_actions(hands, top_rank, top_count)
+
+        # players who are out or have nothing that beats the top cards pass automatically
+        acting = ~self.out[t, p] & ((top_count == 0) | legal[:, 1:].any(axis=1))
+        actions = np.zeros(len(t), dtype=np.int64)
+        for seat in range(self.n):
+            sel = np.flatnonzero(acting & (p == seat))
+            if len(sel):
+                view = BatchView(hands[sel], top_rank[sel], top_count[sel], legal[sel], self.seen[t[sel]])
+                actions[sel] = self.policies[seat](view, self.rng)
+
+        self.play(t, p, actions)
+
+        # test for end of game
+        over = self.n_out[t] >= self.n - 1
+        if over.any():
+            g = t[over]
+            last = (~self.out[g]).argmax(axis=1)
+            self.out[g, last] = True
+            self.out_order[g, self.n - 1] = last
+            self.n_out[g] = self.n
+            self.done[g] = True
+
+        # all players have passed or are out, move play to the last player to lead
+        trick = ~over & (self.passed[t] | self.out[t]).all(axis=1)
+        if trick.any():
+            g = t[trick]
+            self.passed[g] = False
+            self.top_rank[g] = -1
+            self.top_count[g] = 0
+            leader = self.last_player[g]
+            gone = self.out[g, leader]
+            if gone.any(): # if the last player is out, play moves to the next player still in from the current player
+                h = g[gone]
+                seats = (self.curr_player[h][:, None] + np.arange(self.n)[None, :]) % self.n
+                leader[gone] = seats[np.arange(len(h)), (~self.out[h[:, None], seats]).argmax(axis=1)]
+            self.curr_player[g] = leader
+
+        nxt = t[~over & ~trick]
+        self.curr_player[nxt] = (self.curr_player[nxt] + 1) % self.n
+
+    def play(self, t, p, actions):
+        """
+            Applies the int actions of the current players on the tables t.
+            Every player who takes a turn is marked as passed for the rest of the trick, as in ScumController.
+        """
+        self.passed[t, p] = True
+
+        sel = np.flatnonzero(actions > 0)
+        if len(sel) == 0:
+            return
+        t, p, rank = t[sel], p[sel], actions[sel] - 1
+        count = np.where(self.top_count[t] > 0, self.top_count[t], self.hands[t, p, rank])
+        self.hands[t, p, rank] -= count
+        self.sizes[t, p] -= count
+        self.seen[t, rank] += count
+        self.top_rank[t] = rank
+        self.top_count[t] = count
+        self.last_player[t] = p
+
+        went_out = self.sizes[t, p] == 0 # is the player's hand now empty...
+        t, p = t[went_out], p[went_out]
+        self.out[t, p] = True
+        self.out_order[t, self.n_out[t]] = p
+        self.n_out[t] += 1
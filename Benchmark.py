@@ -0,0 +1,266 @@
+"""
+    This file benchmarks the simulation with fixed-seed workloads, and compares the results
+    with a stored baseline.
+
+    Every workload is a generator of operations. Each operation is timed on its own, and the
+    report gives the operations per second, the median and 99th percentile latency, and the peak
+    memory allocated while running the workload (measured with tracemalloc in a separate, untimed pass).
+    Like timeit, the workload is timed several times and the fastest pass is reported,
+    since slower passes mostly measure other load on the machine.
+
+    To run every workload and compare with the baseline, call "python Benchmark.py"
+    to only run the workloads with a name containing some text, add "-w <text>"
+    to save the results as the new baseline, add "-s"
+    to change the regression threshold (0.25 is 25% slower or bigger), add "-t <threshold>"
+    to change the number of timed passes of every workload, add "-r <repeats>"
+    to change the number of runs of every workload, whose median measurements are reported, add "-n <runs>"
+    Exits with status 1 if any workload regressed past the threshold.
+    Baselines only mean something on the machine they were saved on, and on a busy or shared
+    machine the threshold may need to be raised.
+"""
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+import numpy as np
+import Agents
+from Agents import Agent, QAgent, ParamAgent
+from Cards import Deck, Hand, Card, CARD_STRS
+from ScumController import ScumController
+from State import SimpleView, int_state, int_action_space
+from game_record import GameRecordWriter, replay
+from q_learn import QLearning
+from q_train import OfflineTrainer
+
+SEED = 1234
+BASELINE = "results/benchmark_baseline.json"
+THRESHOLD = 0.25
+REPEATS = 5
+RUNS = 3 # runs of every workload, whose median is reported and saved, so a lucky or unlucky spell of the machine doesn't set or fail the bar
+
+
+def seven_agents():
+    return [Agent(Agents.baseline_action), Agent(Agents.baseline_action), Agent(Agents.heuristic_action), Agent(Agents.heuristic_action),
+            Agent(Agents.random_action), Agent(Agents.randomized_baseline_action), Agent(Agents.randomized_baseline_action)]
+
+_record = None
+
+def recorded_game():
+    """
+        A fixed-seed 7 player game, recorded once, whose turns are replayed by the turn workloads.
+    """
+    global _record
+    if _record is None:
+        _record = os.path.join(tempfile.mkdtemp(), "benchmark.scg")
+        random.seed(SEED)
+        controller = ScumController(seven_agents())
+        with GameRecordWriter(_record) as writer:
+            controller.game_record = writer
+            controller.games(1, 10)
+    return _record
+
+
+def deal_trade(n=1000):
+    """
+        Dealing and trading one round of a 7 player game.
+    """
+    random.seed(SEED)
+    controller = ScumController(seven_agents())
+    prev_order = [3, 0, 6, 1, 5, 2, 4]
+    for _ in range(n):
+        yield partial(controller.setup_round, prev_order)
+
+def turns(make_agent):
+    """
+        One get_action call of the agent made by make_agent, on every turn of the recorded game.
+    """
+    random.seed(SEED)
+    agent = make_agent()
+    for _, _, view, _ in replay(recorded_game()):
+        yield partial(agent.get_action, view)
+
+def rounds(n=100):
+    """
+        Full rounds of a 7 player game.
+    """
+    random.seed(SEED)
+    controller = ScumController(seven_agents())
+    scores = [None]
+    def op():
+        scores[0] = controller.round(scores[0], 0)
+    for _ in range(n):
+        yield op
+
+def random_views(n):
+    random.seed(SEED)
+    views = []
+    while len(views) < n:
+        d = Deck()
+        hands = [Hand() for _ in range(random.randint(4, 12))]
+        d.deal_hands(hands)
+        for h in hands:
+            views.append(SimpleView(h, [Card(random.choice(CARD_STRS))] * random.randint(0, 4)))
+    return views[:n]
+
+def encode_states(n=10000):
+    for view in random_views(n):
+        yield partial(int_state, view)
+
+def action_spaces(n=10000):
+    for view in random_views(n):
+        yield partial(int_action_space, view)
+
+def q_updates(n=2000):
+    """
+        QLearning.q_learn on rounds of 10 random decisions, as QAgent.finish_round runs it.
+    """
+    learner = QLearning()
+    states = [int_state(view) for view in random_views(2000)]
+    rng = random.Random(SEED)
+    for _ in range(n):
+        round_data = [(rng.choice(states), rng.randrange(14)) for _ in range(10)]
+        yield partial(learner.q_learn, round_data, rng.choice([-1, 0, 1]))
+
+def q_sweeps(n=3):
+    """
+        Backwards sweeps of OfflineTrainer over 20000 random (s, a, r, sp) tuples.
+    """
+    learner = QLearning()
+    states = [int_state(view) for view in random_views(2000)]
+    rng = random.Random(SEED)
+    trainer = OfflineTrainer.from_tuples([(rng.choice(states), rng.randrange(14), rng.choice([-1, 0, 1]), rng.choice(states)) for _ in range(20000)])
+    trainer.schedule()
+    for _ in range(n):
+        yield partial(trainer.train, learner.Q, 1, verbose=False)
+
+
+WORKLOADS = {
+    "deal_trade" : deal_trade,
+    "turn_baseline" : partial(turns, partial(Agent, Agents.baseline_action)),
+    "turn_heuristic" : partial(turns, partial(Agent, Agents.heuristic_action)),
+    "turn_random" : partial(turns, partial(Agent, Agents.random_action)),
+    "turn_q" : partial(turns, QAgent),
+    "turn_param" : partial(turns, ParamAgent),
+    "round_7" : rounds,
+    "int_state" : encode_states,
+    "int_action_space" : action_spaces,
+    "q_update" : q_updates,
+    "q_sweep" : q_sweeps,
+}
+
+
+def peak_memory(workload):
+    """
+        Runs the workload once under tracemalloc, returning the peak memory it allocated in bytes.
+    """
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    for op in workload():
+        op()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+def time_ops(workload):
+    """
+        Times every operation of one pass of workload, returning the latencies in microseconds.
+    """
+    times = []
+    clock = time.perf_counter_ns
+    for op in workload():
+        t = clock()
+        op()
+        times.append(clock() - t)
+    return np.array(times, dtype=np.float64) / 1000
+
+def run(workload, repeats=REPEATS):
+    """
+        Times every operation of workload, returning the result entry of the fastest of repeats passes.
+    """
+    for op in workload(): # warm up caches and lazy imports, so neither the memory nor the timed passes pay for them
+        op()
+    peak = peak_memory(workload)
+    times = min((time_ops(workload) for _ in range(repeats)), key=np.sum)
+    return {
+        "ops" : len(times),
+        "ops_per_sec" : len(times) / (times.sum() / 1e6),
+        "p50_us" : float(np.percentile(times, 50)),
+        "p99_us" : float(np.percentile(times, 99)),
+        "peak_kib" : peak / 1024,
+    }
+
+def median_result(results):
+    """
+        The median of every measurement over the result entries of several runs of a workload.
+    """
+    return {key : float(np.median([result[key] for result in results])) if key != "ops" else results[0][key] for key in results[0]}
+
+def regressions(result, base, threshold):
+    """
+        The measurements of result that are worse than base by more than threshold.
+    """
+    worse = []
+    if result["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+        worse.append("ops/s")
+    for key in ("p50_us", "p99_us", "peak_kib"):
+        if result[key] > base[key] * (1 + threshold):
+            worse.append(key)
+    return worse
+
+def machine():
+    return {"python" : platform.python_version(), "platform" : platform.platform(), "processor" : platform.processor() or platform.machine()}
+
+
+def main(names=None, save=False, threshold=THRESHOLD, repeats=REPEATS, baseline_path=BASELINE, runs=RUNS):
+    baseline = None
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != machine():
+            print(f"Baseline {baseline_path} was measured on {baseline.get('machine')}, comparisons may not be meaningful")
+
+    results = {}
+    failed = []
+    print(f"{'workload':<18}{'ops':>8}{'ops/s':>12}{'p50 us':>10}{'p99 us':>10}{'peak KiB':>10}  vs baseline")
+    selected = {name : workload for name, workload in WORKLOADS.items() if not names or any(n in name for n in names)}
+    runs_of = {name : [] for name in selected}
+    for _ in range(runs - 1): # every run goes through all the workloads, so the runs of a workload are spread over the whole benchmark
+        for name, workload in selected.items():
+            runs_of[name].append(run(workload, repeats))
+    for name, workload in selected.items():
+        runs_of[name].append(run(workload, repeats)) # the last run, reported as soon as it's done
+        result = median_result(runs_of[name])
+        results[name] = result
+        line = f"{name:<18}{result['ops']:>8}{result['ops_per_sec']:>12.0f}{result['p50_us']:>10.1f}{result['p99_us']:>10.1f}{result['peak_kib']:>10.0f}"
+        if baseline and name in baseline["workloads"]:
+            base = baseline["workloads"][name]
+            line += f"  {result['ops_per_sec'] / base['ops_per_sec']:.2f}x ops/s"
+            worse = regressions(result, base, threshold)
+            if worse:
+                line += "  REGRESSION: " + ", ".join(worse)
+                failed.append(name)
+        print(line, flush=True)
+
+    if save:
+        saved = baseline["workloads"] if baseline and names else {} # keep the workloads that weren't rerun
+        saved.update(results)
+        with open(baseline_path, "w") as f:
+            json.dump({"machine" : machine(), "seed" : SEED, "workloads" : saved}, f, indent=4)
+        print(f"Saved baseline to {baseline_path}")
+    return failed
+
+
+if __name__ == "__main__":
+    names = [sys.argv[i + 1] for i, arg in enumerate(sys.argv) if arg == "-w"]
+    threshold = float(sys.argv[sys.argv.index("-t") + 1]) if "-t" in sys.argv else THRESHOLD
+    repeats = int(sys.argv[sys.argv.index("-r") + 1]) if "-r" in sys.argv else REPEATS
+    runs = int(sys.argv[sys.argv.index("-n") + 1]) if "-n" in sys.argv else RUNS
+    failed = main(names, "-s" in sys.argv, threshold, repeats, runs=runs)
+    if failed:
+        print(f"{len(failed)} workloads regressed: {', '.join(failed)}")
+        sys.exit(1)
@@ -4,9 +4,9 @@
 """
 from functools import total_ordering
 import random
-from collections import Counter
 
 CARD_STRS = [str(val) + suit for val in list(range(2, 11)) + ["J", "Q", "K", "A"] for suit in ["C", "D", "S", "H"]]
+CARD_INDEX = {name : i for i, name in enumerate(CARD_STRS)} # position of each card in the sorted deck (and its bit in a hand mask)
 VALUE_DICT = {
     "J" : 11,
     "Q" : 12,
@@ -46,38 +46,30 @@ def compute_playable(hand):
         because the hand can play on anything Queen (rank 12) or below singles,
         anything 9 or below doubles, and can't play on triples or quads.
     """
-    ranks = [card.rank() for card in hand.cards]
-    r = [0] * 4
-    c = Counter(ranks)
-    for rank, cnt in c.items():
-        for i in range(cnt):
-            r[i] = max(r[i], rank - 1) # the highest we can play at any lower count is 1 less than the rank here
-    return r
+    return hand.playable()
 
 def default_give(president_hand):
     """
         Find the card that the president would give by default
         (lowest unpaired card)
     """
-    ranks = [card.rank() for card in president_hand.cards]
-    c = Counter(ranks)
-    try:
-        give_rank = min(rank for rank, cnt in c.items() if cnt == 1)
-    except ValueError: # if there are no unpaired cards, just return the smallest card
-        return president_hand.cards[0]
-
-    for card in president_hand.cards:
-        if card.rank() == give_rank:
-            return card
+    counts = president_hand.rank_counts
+    for r in range(13):
+        if counts[r] == 1:
+            return president_hand.lowest_of_rank(r)
+    return president_hand.lowest() # if there are no unpaired cards, just return the smallest card
 
 
 def default_trade(president_hand, scum_hand):
     """
         Baseline implementation of basic auto-trading between president and scum.
+        Returns the card the scum gave and the card the president gave back.
     """
+    if president_hand is scum_hand:
+        return None # the middle player of an odd sized game trades with themselves, which changes nothing
 
     # scum gives their highest card
-    scum_give = scum_hand.cards[-1]
+    scum_give = scum_hand.highest()
     president_hand.get(scum_give)
     scum_hand.remove(scum_give)
 
@@ -85,6 +77,44 @@ def default_trade(president_hand, scum_hand):
     pres_give = default_give(president_hand)
     president_hand.remove(pres_give)
     scum_hand.get(pres_give)
+    return scum_give, pres_give
+
+
+TRADES = [(0, 3), (1, 2), (2, 1)] # (position in previous order, number of trades with the mirrored position)
+
+def trade_hands(president_hand, scum_hand, times):
+    """
+        Runs default_trade times between president_hand and scum_hand, working on the masks and
+        rank counts of the hands directly. Returns the default_trade result of every trade.
+    """
+    if president_hand is scum_hand:
+        return [None] * times
+    pres, scum = president_hand.mask, scum_hand.mask
+    pres_counts, scum_counts = president_hand.rank_counts, scum_hand.rank_counts
+    moves = []
+    for _ in range(times):
+        give = scum.bit_length() - 1 # scum gives their highest card
+        scum ^= 1 << give
+        pres |= 1 << give
+        scum_counts[give >> 2] -= 1
+        pres_counts[give >> 2] += 1
+
+        if 1 in pres_counts: # president gives away the lowest unpaired card
+            r = pres_counts.index(1)
+            back = (r << 2) + ((pres >> (r << 2)) & 0xF).bit_length() - 1
+        else: # if there are no unpaired cards, the smallest card
+            back = (pres & -pres).bit_length() - 1
+        pres ^= 1 << back
+        scum |= 1 << back
+        pres_counts[back >> 2] -= 1
+        scum_counts[back >> 2] += 1
+        moves.append((CARDS[give], CARDS[back]))
+
+    for hand, mask in ((president_hand, pres), (scum_hand, scum)):
+        hand.mask = mask
+        hand._cards = None
+        hand._playable = None
+    return moves
 
 
 
@@ -98,15 +128,13 @@ class Card:
             Suits are (H)earts, (S)pades, (C)lubs, (D)iamonds
         """
         self.name = name
+        self.index = CARD_INDEX[name]
 
     def rank(self):
         """
             Get the rank of the card, in ordered int form.
         """
-        v = self.name[:-1]
-        if v in VALUE_DICT:
-            v = VALUE_DICT[v]
-        return int(v)
+        return (self.index >> 2) + 2 # the deck is sorted by rank, with 4 suits per rank
 
 
     def __eq__(self, other):
@@ -115,7 +143,7 @@ class Card:
         return False
 
     def __lt__(self, other):
-        return CARD_STRS.index(self.name) < CARD_STRS.index(other.name)
+        return self.index < other.index
 
     def __hash__(self):
         return self.name.__hash__()
@@ -126,39 +154,238 @@ class Card:
     def __repr__(self):
         return self.name
 
+CARDS = [Card(s) for s in CARD_STRS] # one shared Card per name, in sorted order
+
 class Hand:
+    """
+        A Hand is stored as a 52-bit mask of the cards it holds (bit i is CARD_STRS[i])
+        and a 13-slot count of how many cards of each rank it holds (slot 0 is the 2s).
+        Both are updated on every get / remove, and the sorted list of cards and the
+        playability of the hand are derived from them only when asked for.
+    """
     def __init__(self):
-        self.cards = []
+        self.mask = 0
+        self.rank_counts = [0] * 13
+        self.size = 0
+        self._cards = [] # cached sorted cards, None when the hand has changed since the last build
+        self._playable = [0] * 4 # cached compute_playable result, None when stale
+
+    @property
+    def cards(self):
+        """
+            The cards in the hand, sorted from lowest to highest.
+        """
+        if self._cards is None:
+            cards = []
+            m = self.mask
+            while m:
+                low = m & -m # lowest set bit is the lowest card left
+                cards.append(CARDS[low.bit_length() - 1])
+                m ^= low
+            self._cards = cards
+        return self._cards
+
+    def playable(self):
+        """
+            The largest rank playable at each multiple threshold, see compute_playable.
+        """
+        if self._playable is None:
+            r = [0] * 4
+            filled = 0
+            for i in range(12, -1, -1): # go from the highest rank down, so the first rank to fill a count is the largest
+                for k in range(filled, self.rank_counts[i]):
+                    r[k] = i + 1 # rank i + 2 beats anything up to rank i + 1
+                    filled = k + 1
+                if filled == 4:
+                    break
+            self._playable = r
+        return self._playable
+
+    def has(self, card):
+        return (self.mask >> card.index) & 1 == 1
+
+    def lowest(self):
+        return CARDS[(self.mask & -self.mask).bit_length() - 1]
+
+    def highest(self):
+        return CARDS[self.mask.bit_length() - 1]
+
+    def lowest_of_rank(self, r):
+        """
+            The lowest card of rank index r (0 is the 2s) in the hand.
+        """
+        suits = (self.mask >> (r << 2)) & 0xF
+        return CARDS[(r << 2) + (suits & -suits).bit_length() - 1]
 
     def get(self, card):
-        self.cards.append(card)
-        self.cards.sort()
+        self.mask |= 1 << card.index
+        self.rank_counts[card.index >> 2] += 1
+        self.size += 1
+        self._cards = None
+        self._playable = None
 
     def remove(self, cards):
         if not isinstance(cards, tuple):
             cards = (cards,) # wrap singleton cards to be lists for universality
         for card in cards:
-            if card not in self.cards:
+            if not self.has(card):
                 raise ValueError(f"Attempted to remove card {card} from hand {self.cards}")
-            self.cards.remove(card)
-        self.cards.sort()
+            self.mask ^= 1 << card.index
+            self.rank_counts[card.index >> 2] -= 1
+            self.size -= 1
+        self._cards = None
+        self._playable = None
+
+    def copy(self):
+        hand = Hand()
+        hand.mask = self.mask
+        hand.rank_counts = list(self.rank_counts)
+        hand.size = self.size
+        hand._cards = None
+        hand._playable = None
+        return hand
+
+    def set_cards(self, cards):
+        """
+            Replaces the cards of the hand with cards, in a single pass.
+        """
+        mask = 0
+        counts = [0] * 13
+        for card in cards:
+            mask |= 1 << card.index
+            counts[card.index >> 2] += 1
+        self.mask = mask
+        self.rank_counts = counts
+        self.size = len(cards)
+        self._cards = None
+        self._playable = None
 
     def clear(self):
-        self.cards = []
+        self.mask = 0
+        self.rank_counts = [0] * 13
+        self.size = 0
+        self._cards = []
+        self._playable = [0] * 4
 
     def __len__(self):
-        return len(self.cards)
+        return self.size
 
     def __repr__(self):
         return " ".join(map(str, self.cards))
 
 
-class Deck:
+FULL_MASK = (1 << len(CARD_STRS)) - 1
+NIBBLES_1 = 0x5555555555555 # 01 in every 2 bit field of a 52 bit mask
+NIBBLES_2 = 0x3333333333333 # 0011 in every nibble
+NIBBLES_8 = 0x8888888888888 # the top bit of every nibble
+
+def rank_mask(mask, k):
+    """
+        Given a 52-bit card mask, returns a mask with bit 4r + 3 set for every rank index r
+        with at least k (1-4) cards in the mask, counting the suits of every rank at once.
+    """
+    x = mask - ((mask >> 1) & NIBBLES_1)
+    x = (x & NIBBLES_2) + ((x >> 2) & NIBBLES_2) # every nibble now holds the number of cards of its rank
+    return (x + (8 - k) * 0x1111111111111) & NIBBLES_8 # a count of at least k carries into the top bit
+
+class SeenCards:
+    """
+        The cards played so far in a round, stored like a Hand as a 52-bit mask
+        and a 13-slot count of how many cards of each rank were played (slot 0 is the 2s).
+        Ranks are rank indices (0 is the 2s), and queries can take the hand of the player asking,
+        whose cards are known to them even though they haven't been played.
+    """
     def __init__(self):
+        self.mask = 0
+        self.rank_counts = [0] * 13
+        self.size = 0
+
+    def add(self, cards):
+        for card in cards:
+            self.mask |= 1 << card.index
+            self.rank_counts[card.index >> 2] += 1
+        self.size += len(cards)
+
+    def clear(self):
+        self.mask = 0
+        self.rank_counts = [0] * 13
+        self.size = 0
+
+    def copy(self):
+        seen = SeenCards()
+        seen.mask = self.mask
+        seen.rank_counts = list(self.rank_counts)
+        seen.size = self.size
+        return seen
+
+    def unseen_mask(self, hand=None):
+        """
+            The mask of the cards neither played nor in hand.
+        """
+        mask = self.mask
+        if hand is not None:
+            mask |= hand.mask
+        return FULL_MASK & ~mask
+
+    def unseen(self, r, hand=None):
+        """
+            The number of cards of rank index r still held by the other players.
         """
-            Every deck starts as a shuffled list of cards.
+        n = 4 - self.rank_counts[r]
+        if hand is not None:
+            n -= hand.rank_counts[r]
+        return n
+
+    def highest_unseen(self, hand=None):
+        """
+            The highest rank index still held by the other players, -1 if they hold nothing.
+        """
+        return (self.unseen_mask(hand).bit_length() - 1) >> 2
+
+    def can_beat(self, top_cards, hand=None):
+        """
+            Whether the cards still held by the other players include a set that beats top_cards
+            (any card at all on an empty table).
+        """
+        if not top_cards:
+            return self.unseen_mask(hand) != 0
+        above = ((top_cards[0].index >> 2) + 1) * 4 # the first bit of the ranks above the top cards
+        return rank_mask(self.unseen_mask(hand), len(top_cards)) >> above != 0
+
+    def array(self):
         """
-        self.cards = [Card(s) for s in CARD_STRS]
+            The played rank counts as a length 13 NumPy array, to stack into batched features.
+        """
+        import numpy as np
+        return np.array(self.rank_counts, dtype=np.int8)
+
+    def __contains__(self, card):
+        return (self.mask >> card.index) & 1 == 1
+
+    def __iter__(self):
+        m = self.mask
+        while m:
+            low = m & -m
+            yield CARDS[low.bit_length() - 1]
+            m ^= low
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return " ".join(map(str, self))
+
+
+class Deck:
+    def __init__(self, cards=None):
+        """
+            Every deck starts as a shuffled list of cards, or as a copy of cards when they are given
+            (cards are dealt from the end of the list).
+        """
+        if cards is not None:
+            self.cards = list(cards)
+            return
+        self.cards = list(CARDS)
         random.shuffle(self.cards)
 
     def deal(self):
@@ -169,11 +396,11 @@ class Deck:
             Deals the entire deck into n different hands.
             president is the index of the president (dealing starts at the president)
         """
-        n = len(hands) # make sure the hands are empty before dealing to them.
-        for hand in hands:
-            hand.clear()
-        for i in range(len(self.cards)):
-            hands[(i + president) % n].get(self.deal()) # deal the card to the next player in a circle.
+        n = len(hands)
+        order = self.cards[::-1] # cards are dealt from the end of the deck, one to each player in a circle
+        for i, hand in enumerate(hands):
+            hand.set_cards(order[(i - president) % n::n]) # every nth card, starting with the one dealt to player i
+        self.cards = []
 
         return hands
 
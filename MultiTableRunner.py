@@ -0,0 +1,122 @@
+"""
+    This file runs many ScumController tables together in one process, batching the decisions of
+    learned agents across the tables.
+
+    Every table is a generator that plays its games turn by turn. Agents with an action_steps method
+    (QAgent and ParamAgent) choose their action with a generator too, which yields a request
+    (batch function, item) when it needs its Q table or model, and is sent back the result.
+    A table whose agent yields a request is suspended until the request is answered,
+    so its gamestate and view stay as they were.
+    Once every table is waiting, the requests are grouped by batch function and each group is answered
+    with a single call, so with n_tables tables a learned agent scores up to n_tables decisions at once.
+
+    For requests to be batched together, the tables' agents have to share their Q table or model,
+    which table_agents sets up. Agents that learn keep learning from every table.
+"""
+import copy
+from collections import Counter
+from ScumController import ScumController
+from Agents import DataCollectingAgent
+
+MAX_ITER = 1000
+
+
+def table_agents(agents, n_tables):
+    """
+        n_tables copies of agents, one list per table. Every copy has its own round data,
+        but shares everything else (like its Q table or model) with the other copies of the same agent.
+    """
+    tables = []
+    for _ in range(n_tables):
+        table = []
+        for agent in agents:
+            agent = copy.copy(agent)
+            if isinstance(agent, DataCollectingAgent):
+                agent.round_data = []
+                agent.data = []
+            table.append(agent)
+        tables.append(table)
+    return tables
+
+
+def play_round(controller, prev_order, round):
+    """
+        controller.round as a generator, passing on the requests of agents with action_steps.
+    """
+    controller.setup_round(prev_order)
+    view = controller.view
+    for i in range(MAX_ITER):
+        p = controller.curr_player
+        view.move_to(p)
+        agent = controller.agents[p]
+        steps = getattr(agent, "action_steps", None)
+        if steps is None:
+            action = agent.get_action(view)
+        else:
+            action = yield from steps(view)
+        scores = controller.advance(action, round)
+        if scores is not None:
+            controller.end_round(scores, i + 1)
+            return scores
+    raise ValueError("Max Iter reached")
+
+
+def play_games(controller, n_games, n_rounds):
+    """
+        controller.games as a generator, returning the same placement Counters.
+    """
+    player_results = [[] for _ in range(controller.n)]
+    scores = None
+    for g in range(n_games):
+        for r in range(n_rounds):
+            scores = yield from play_round(controller, scores, r)
+            controller.finish_round()
+            for i in range(controller.n):
+                player_results[scores[i]].append(i)
+
+        for agent in controller.agents:
+            if isinstance(agent, DataCollectingAgent):
+                controller.collected_data += agent.data
+                agent.data = []
+    return [Counter(result) for result in player_results]
+
+
+def run_tables(tables):
+    """
+        Runs table generators until they have all finished, answering their requests in batches.
+        Returns the return value of every table, and the number of batch calls and requests answered.
+    """
+    results = [None] * len(tables)
+    pending = [] # (table index, generator, request) of every suspended table
+    for t, table in enumerate(tables):
+        try:
+            pending.append((t, table, next(table)))
+        except StopIteration as stop:
+            results[t] = stop.value
+
+    calls = requests = 0
+    while pending:
+        groups = {}
+        for t, table, (function, item) in pending:
+            groups.setdefault(function, []).append((t, table, item))
+        pending = []
+        for function, group in groups.items():
+            answers = function([item for _, _, item in group])
+            calls += 1
+            requests += len(group)
+            for (t, table, _), answer in zip(group, answers):
+                try:
+                    pending.append((t, table, table.send(answer)))
+                except StopIteration as stop:
+                    results[t] = stop.value
+    return results, calls, requests
+
+
+def multi_table_games(agents, n_tables, n_games, n_rounds):
+    """
+        Plays controller.games(n_games, n_rounds) on n_tables tables of copies of agents at once,
+        batching their learned decisions. Returns every table's results, as ParallelRunner.parallel_games does.
+    """
+    controllers = [ScumController(table) for table in table_agents(agents, n_tables)]
+    results, _, _ = run_tables([play_games(controller, n_games, n_rounds) for controller in controllers])
+    return results
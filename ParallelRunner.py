@@ -0,0 +1,79 @@
+"""
+    This file runs ScumController.games calls in parallel over a process pool.
+
+    Work is split into shards, and every shard builds its own agents with make_agents,
+    seeds its own RNG stream from (seed, shard index), and plays its games in a fresh controller.
+    Because the shards and their seeds do not depend on the number of workers,
+    the merged results for a fixed seed are the same however many processes are used.
+
+    make_agents (and anything it references) has to be picklable, so use a top level function
+    or a functools.partial of one, not a lambda.
+"""
+import copy
+import random
+from collections import Counter
+from multiprocessing import get_context, cpu_count
+from ScumController import ScumController
+
+
+def shard_seed(seed, shard):
+    """
+        The seed of the RNG stream of a shard.
+    """
+    return seed * 1000003 + shard
+
+
+def run_shard(args):
+    """
+        Plays one shard of games in the current process.
+    """
+    make_agents, n_games, n_rounds, seed = args
+    random.seed(seed)
+    controller = ScumController(make_agents())
+    return controller.games(n_games, n_rounds)
+
+
+def iter_parallel_games(make_agents, n_shards, n_games, n_rounds, seed=0, processes=None):
+    """
+        Plays n_shards independent shards of controller.games(n_games, n_rounds).
+        Yields the per-shard results (lists of placement Counters) in shard order as they finish.
+        processes=1 runs every shard in this process, None uses every core.
+    """
+    jobs = [(make_agents, n_games, n_rounds, shard_seed(seed, i)) for i in range(n_shards)]
+    if processes is None:
+        processes = cpu_count()
+    processes = min(processes, n_shards)
+    if processes <= 1:
+        for job in jobs:
+            yield run_shard(copy.deepcopy(job)) # like a pool worker, every shard gets its own copy of make_agents
+        return
+
+    # spawn rather than fork, so workers start the same way on every platform and never inherit pygame's state
+    pool = get_context("spawn").Pool(processes)
+    try:
+        yield from pool.imap(run_shard, jobs, chunksize=1)
+        pool.close() # let the workers exit on their own, pygame's signal handlers can keep terminate() waiting
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def parallel_games(make_agents, n_shards, n_games, n_rounds, seed=0, processes=None):
+    """
+        Same as iter_parallel_games, but returns the list of every shard's results.
+    """
+    return list(iter_parallel_games(make_agents, n_shards, n_games, n_rounds, seed, processes))
+
+
+def merge_results(shard_results):
+    """
+        Sums per-shard placement Counters into one list of Counters, one per agent.
+    """
+    merged = [Counter() for _ in shard_results[0]]
+    for results in shard_results:
+        for k, result in enumerate(results):
+            merged[k].update(result)
+    return merged
+
@@ -1,27 +1,50 @@
-from numpy.lib.function_base import average
 from ScumController import ScumController
+from ParallelRunner import iter_parallel_games, merge_results
+from experience import ExperienceWriter, ExperienceReader
+from duplicate import duplicate_games, mean_interval, report
+from sequential import RankingMonitor
 from Agents import QAgent, ParamAgent, baseline_action, getter, Agent, DataCollectingAgent, heuristic_action
 import Agents
-from graphics import quit_pygame
 import sys
 from State import test_state
 import pickle
 import random
 import time
-import pandas as pd
 from collections import defaultdict
+from functools import partial
 
-import matplotlib.pyplot as plt
 
-def test_agent_against(agent, opponent_func, n_games, n_rounds, n_agents=7, draw=False, tick_speed=3):
+def agents_against(agent, opponent_func, n_agents):
+    return [agent] + [opponent_func() for _ in range(n_agents-1)]
+
+def test_agent_against(agent, opponent_func, n_games, n_rounds, n_agents=7, draw=False, tick_speed=3, processes=None, seed=0):
     """
         Tests a given agent against a given type of opponent.
+        With processes set, every game is played by a copy of the agent in a worker process,
+        so anything the agent learns during the test is not kept.
     """
-    agents = [agent] + [opponent_func() for _ in range(n_agents-1)]
+    if processes and not draw:
+        make_agents = partial(agents_against, agent, opponent_func, n_agents)
+        results = merge_results(list(iter_parallel_games(make_agents, n_games, 1, n_rounds, seed, processes)))
+        return interpret_results(results, display=False)
+
+    agents = agents_against(agent, opponent_func, n_agents)
     controller = ScumController(agents, draw=draw, tick_speed=tick_speed)
     results = controller.games(n_games, n_rounds)
     return interpret_results(results, display=False)
 
+def duplicate_agent_against(agent, opponent_func, n_boards, n_agents=7, seed=0, level=0.95):
+    """
+        Tests a given agent against a given type of opponent on duplicate boards (see duplicate.py).
+        Returns the agent's average placement and its mean paired difference with the opponents, as (mean, low, high).
+    """
+    agents = agents_against(agent, opponent_func, n_agents)
+    board_placements = duplicate_games(agents, n_boards, seed)
+    placement = sum(placements[0] for placements in board_placements) / n_boards
+    # difference of the agent with the average opponent on every board
+    mean, half = mean_interval([placements[0] - sum(placements[1:]) / (n_agents - 1) for placements in board_placements], level)
+    return placement, (mean, mean - half, mean + half)
+
 def self_play(agents, n_games, n_rounds, draw=False, tick_speed=3):
     """
         Simulated play among the given agents.
@@ -39,11 +62,11 @@ def interpret_results(results, display=True, agent=0):
 
     return avg_placement, results[0][0] / n_rounds
 
-def test_agent(agent, agentname, n_games, n_rounds, draw=False, tick_speed=3):
+def test_agent(agent, agentname, n_games, n_rounds, draw=False, tick_speed=3, processes=None, seed=0):
     """
         Calls test_agent_against on baseline agents.
     """
-    ap1, wr1 = test_agent_against(agent, getter(Agents.baseline_action), n_games, n_rounds, 7, draw=draw, tick_speed=tick_speed)
+    ap1, wr1 = test_agent_against(agent, getter(Agents.baseline_action), n_games, n_rounds, 7, draw=draw, tick_speed=tick_speed, processes=processes, seed=seed)
     # print(f"Against baseline opponents, Agent {agentname} had placement {ap1} and winrate {wr1}")
 
     return ap1, wr1
@@ -51,7 +74,7 @@ def test_agent(agent, agentname, n_games, n_rounds, draw=False, tick_speed=3):
 def generate_data(n_rounds, draw, tick_speed, reward):
     """
         Generates data by simulating games.
-        Saves the results as pickle files to be used by Q-learning.
+        Saves the results as an experience log (see experience.py) to be used by Q-learning.
     """
     baseline_agents = [DataCollectingAgent(Agents.baseline_action, reward) for _ in range(3)]
     heuristic_agents = [DataCollectingAgent(Agents.heuristic_action, reward) for _ in range(2)]
@@ -62,23 +85,23 @@ def generate_data(n_rounds, draw, tick_speed, reward):
 
     agents = [DataCollectingAgent(Agents.randomized_baseline_action, 1) for _ in range(7)]
     controller = ScumController(amalgam_agents, draw=draw, tick_speed=tick_speed)
-    controller.game(n_rounds)
+    with ExperienceWriter("data/randbaseheur_backprop_10000.exp") as writer:
+        controller.experience_writer = writer # stream the data to disk as rounds finish
+        controller.games(1, n_rounds)
 
-    with open("data/randbaseheur_backprop_10000.p", "wb") as f:
-        pickle.dump(controller.collected_data, f)
-
-    # for testing data pickling
-    with open("data/randbaseheur_backprop_10000.p", "rb") as f:
-        data = pickle.load(f)
-
-    subset = random.choices(data, k=20)
+    # for testing the experience log
+    records = ExperienceReader("data/randbaseheur_backprop_10000.exp").memmap()
+    print(f"{len(records)} tuples collected")
     print("s, a, r, sp")
-    with open("data/randbaseheur_backprop_10000.txt", "a") as f:
-        for s, a, r, sp in data:
-            # print(f"{s}, {a}, {r:.2f}, {sp}")
-            f.write(f"{s}, {a}, {r:.2f}, {sp} \n")
+    for s, a, r, sp in records[random.sample(range(len(records)), k=min(20, len(records)))]:
+        print(f"{s}, {a}, {r:.2f}, {sp}")
 
-def learn_test(agents):
+def learn_test(agents, processes=None):
+    """
+        Alternates self-play, where the agents learn, with tests of the first agent against baseline agents.
+        With processes set, the test games are spread over a process pool, each iteration with its own seed,
+        so the agent only learns during self-play.
+    """
     selfplay_results = []
     test_results = []
     selfplay_games = 10
@@ -89,7 +112,7 @@ def learn_test(agents):
     t1 = time.time()
     for i in range(num_iterations):
         selfplay_results.append(self_play(agents, selfplay_games, selfplay_rounds))
-        test_results.append(test_agent(agents[0], "Q-Learning Agent", test_games, test_rounds))
+        test_results.append(test_agent(agents[0], "Q-Learning Agent", test_games, test_rounds, processes=processes, seed=i))
         print(f"after {i} iterations and {(time.time() - t1):.1f}s runtime, testresults are: {test_results[-1]}", flush=True)
 
 
@@ -98,6 +121,7 @@ def learn_test(agents):
     tr_place = [x[0] for x in test_results]
     tr_wr = [x[1] for x in test_results]
 
+    import pandas as pd # only loaded when results are saved
     results_dict = {"Self-play Places":sp_place, "Self-play Win Rate":sp_wr, "Test Results Places":tr_place, "Test Results Win Rate":tr_wr}
     df = pd.DataFrame(results_dict)
     df.to_csv(r'results\qlearn_results.csv')
@@ -105,16 +129,15 @@ def learn_test(agents):
     # pickle.dump(agents[0].get_q(), open("Q/best_randbase_backprop_100000_0.p", "wb"))
 
     for i in range(len(agents)):
-        name = "Q/best_randbase_backprop_100000_" + str(i) + ".p"
-        pickle.dump(agents[i].get_q(), open(name, "wb"))
+        name = "Q/best_randbase_backprop_100000_" + str(i) + ".qt"
+        agents[i].learner.save_table(name)
 
     return selfplay_results, test_results
 
 
-def final_tournament(draw, tick_speed):
+def tournament_agents():
     """
-        Generates data by simulating games.
-        Saves the results as pickle files to be used by Q-learning.
+        Builds the agents of the final tournament.
     """
     random_agent = Agent(Agents.random_action)
     baseline_agent = Agent(Agents.baseline_action)
@@ -125,29 +148,52 @@ def final_tournament(draw, tick_speed):
     param_agent = ParamAgent()
     param_agent.param_model = agents_old[0].param_model
 
-    agents = [random_agent, baseline_agent, heuristic_agent, q_learn_agent, param_agent]
+    return [random_agent, baseline_agent, heuristic_agent, q_learn_agent, param_agent]
 
+def final_tournament(draw, tick_speed, processes=None, seed=0, early_stop=False, time_budget=None, num_iterations=100, level=0.95):
+    """
+        Plays the final tournament between all of our agents, and saves the results in results/.
+        With processes set, the iterations are spread over a process pool, each with fresh agents.
+        With early_stop, the tournament stops as soon as the ranking of the agents is settled at the confidence level
+        (see sequential.py), and with time_budget (in seconds) it stops once the budget has run out.
+        Either way it plays at most num_iterations iterations of final_games games of final_rounds rounds.
+    """
     final_games = 10
     final_rounds = 10
-    num_iterations = 100
     agent_results = [[],[],[],[],[]]
-    ind_results = [defaultdict(int) for _ in range(len(agents))]
+    ind_results = [defaultdict(int) for _ in range(len(agent_results))]
     moving_avg = [0, 0, 0, 0, 0]
+    if processes and not draw:
+        n_agents = len(agent_results)
+        iteration_results = iter_parallel_games(tournament_agents, num_iterations, final_games, final_rounds, seed, processes)
+    else:
+        agents = tournament_agents()
+        n_agents = len(agents)
+        iteration_results = (ScumController(agents, draw=draw, tick_speed=tick_speed).games(final_games, final_rounds) for _ in range(num_iterations))
+    monitor = RankingMonitor(n_agents, level)
+
     t1 = time.time()
-    for i in range(num_iterations):
-        controller = ScumController(agents, draw=draw, tick_speed=tick_speed)
-        results = controller.games(final_games, final_rounds)
-        for k in range(len(agents)):
+    for i, results in enumerate(iteration_results):
+        for k in range(n_agents):
             ap, _ = interpret_results(results, display=False, agent=k)
             agent_results[k].append(ap)
             for res, cnt in results[k].items():
                 ind_results[k][res] += cnt
             avg_placement = sum((placement + 1) * cnt for placement, cnt in ind_results[k].items()) / (final_rounds*(i+1)*final_games)
             moving_avg[k] = avg_placement
+        monitor.add([agent_results[k][-1] for k in range(n_agents)])
 
         print(f"It has been {i} iterations with {(time.time() - t1):.1f}s runtime with moving average {moving_avg}", flush=True)
+        if early_stop and monitor.settled():
+            print(f"The ranking {monitor.ranking()} is settled after {i + 1} iterations", flush=True)
+            break
+        if time_budget is not None and time.time() - t1 >= time_budget:
+            print(f"Stopping after {i + 1} iterations, the time budget has run out with {len(monitor.unsettled())} pairs of agents unsettled", flush=True)
+            break
+    iteration_results.close() # stops the workers if the tournament stopped early
 
 
+    import pandas as pd
     results_dict = {"Random Placement":agent_results[0], "Baseline Placement":agent_results[1],
                     "Heuristic Placement":agent_results[2], "Q-Learning Placement":agent_results[3], "Parameter Learning Placement":agent_results[4]}
     df = pd.DataFrame(results_dict)
@@ -163,8 +209,18 @@ def final_tournament(draw, tick_speed):
 
 
 
-def main(draw, tick_speed):
-    test_state()
+def duplicate_tournament(n_boards, draw=False, tick_speed=3, seed=0):
+    """
+        Plays the tournament agents on duplicate boards, printing their placements and paired differences with the random agent.
+    """
+    agents = tournament_agents()
+    board_placements = duplicate_games(agents, n_boards, seed, draw, tick_speed)
+    print(report(board_placements, agents))
+
+
+def main(draw, tick_speed, processes=None, self_check=False, early_stop=False, time_budget=None):
+    if self_check:
+        test_state()
     # a = QAgent(r"data\randbase_backprop_100000.p")
     # b = Agent(Agents.heuristic_action)
     # c = Agent(Agents.baseline_action)
@@ -192,16 +248,38 @@ def main(draw, tick_speed):
     # agents = [QAgent("data/randbase_backprop_100000.p") for _ in range(7)]
     # learn_test(agents)
 
-    final_tournament(draw, tick_speed)
+    final_tournament(draw, tick_speed, processes, early_stop=early_stop, time_budget=time_budget)
 
 
 
 # to run with graphics and control tick speed, call "python Scum.py -d <a number from 1 - 5>"
+# to spread the tournament over worker processes, call "python Scum.py -j <number of processes>"
+# to watch a live table while the games run at full speed on their own thread, add "-l" to "-d"
+# to check the state encoding before running, add "-t"
+# to play the tournament agents on duplicate boards instead, call "python Scum.py -u <number of boards>"
+# to stop the tournament once the ranking of the agents is statistically settled, add "-e"
+# to stop the tournament after some number of seconds, add "-b <seconds>"
 if __name__ == "__main__":
     draw = "-d" in sys.argv
-    tick_speed = 3 if len(sys.argv) <= 2 else int(sys.argv[2])
-    if "-g" in sys.argv:
-        generate_data(100000, draw, tick_speed, 1)
+    if draw and "-l" in sys.argv:
+        draw = "live"
+    tick_speed = 3
+    if draw and sys.argv.index("-d") + 1 < len(sys.argv) and sys.argv[sys.argv.index("-d") + 1].isdigit():
+        tick_speed = int(sys.argv[sys.argv.index("-d") + 1])
+    processes = int(sys.argv[sys.argv.index("-j") + 1]) if "-j" in sys.argv else None
+    def run():
+        if "-g" in sys.argv:
+            generate_data(100000, draw, tick_speed, 1)
+        elif "-u" in sys.argv:
+            duplicate_tournament(int(sys.argv[sys.argv.index("-u") + 1]), draw, tick_speed)
+        else:
+            time_budget = float(sys.argv[sys.argv.index("-b") + 1]) if "-b" in sys.argv else None
+            main(draw, tick_speed, processes, self_check="-t" in sys.argv, early_stop="-e" in sys.argv, time_budget=time_budget)
+    if draw == "live":
+        from graphics import run_live
+        run_live(run) # the games run on their own thread, pygame stays on the main thread
     else:
-        main(draw, tick_speed)
-        quit_pygame()
\ No newline at end of file
+        run()
+        if draw:
+            from graphics import quit_pygame
+            quit_pygame()
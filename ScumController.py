@@ -21,12 +21,12 @@
 """
 
 from os.path import exists
-from Cards import Deck, Hand, Card
-from Cards import is_set, compute_playable, default_trade
+from Cards import Deck, Hand, Card, SeenCards
+from Cards import is_set, compute_playable, trade_hands, TRADES
 from Agents import Agent, DataCollectingAgent
 from State import AgentView
 from collections import Counter
-from graphics import draw_graphics, quit_pygame, set_up_graphics
+from phase_stats import PhaseStats, clock
 import random
 import time
 
@@ -41,7 +41,7 @@ class GameState:
         self.n = n
         self.hands = [Hand() for _ in range(n)] # list of Hand objects for the players (a Hand is just a list of cards, see Cards.py)
         self.out = [] # ordered list of players who are out, with the first player out first in the list
-        self.cards_seen = [] # optional parameter for us to use, this is a list of all cards played.
+        self.cards_seen = SeenCards() # the cards played this round, see Cards.SeenCards for the card counting queries
         self.top_cards = [] # the most recently played card(s)
         self.passed = [False] * self.n # list of booleans, True if the player has passed on the current round
         self.last_player = 0 # the most recent player to play a card (the person who opens if the current card is passed on by all)
@@ -50,6 +50,28 @@ class GameState:
         self.rounds_won = [0 for _ in range(n)]
         self.play_order = [i for i in range(n)]
         self.tick_speed = tick_speed
+        self.reset_players()
+
+    def reset_players(self):
+        """
+            Resets the bookkeeping the controller uses to find the next player in constant time:
+            out_mask has bit p set when player p is out, next_active / prev_active link the players
+            who are not out in a ring, and waiting counts the players who are neither out nor passed.
+        """
+        self.out_mask = 0
+        self.next_active = [(p + 1) % self.n for p in range(self.n)]
+        self.prev_active = [(p - 1) % self.n for p in range(self.n)]
+        self.waiting = self.n
+
+    def go_out(self, p):
+        """
+            Marks player p as out, unlinking them from the ring of active players.
+            next_active[p] is kept, so play can still move on from p (following the links until a player who is not out).
+        """
+        self.out.append(p)
+        self.out_mask |= 1 << p
+        self.next_active[self.prev_active[p]] = self.next_active[p]
+        self.prev_active[self.next_active[p]] = self.prev_active[p]
 
     def reset(self):
         """
@@ -58,10 +80,11 @@ class GameState:
         for hand in self.hands:
             hand.clear()
         self.out = []
-        self.cards_seen = []
+        self.cards_seen.clear()
         self.top_cards = []
         self.passed = [False] * self.n
         self.last_player = 0
+        self.reset_players()
 
     def __repr__(self):
         return str(self)
@@ -81,7 +104,10 @@ class GameState:
 class ScumController:
     def __init__(self, agents, names=None, draw=False, tick_speed=3):
         """
-            Initialize a scum game with agents as the players in the game
+            Initialize a scum game with agents as the players in the game.
+            With draw=True every turn is drawn as it is played, waiting for the tick speed delay.
+            With draw="live" turns are published to the window instead, and the game runs at full speed.
+            The game then has to run inside graphics.run_live, which draws them on the main thread.
         """
         self.n = len(agents)
         self.agents = agents
@@ -90,14 +116,31 @@ class ScumController:
         else:
             self.names = names
         self.gamestate = GameState(self.n, self.names, tick_speed)
+        self.view = AgentView(self.gamestate, 0) # the one view handed to every agent, moved to the player to act each turn
         self.president = random.randrange(self.n)
         self.curr_player = self.president
         self.scum = self.n - 1
         self.draw = draw
         self.collected_data = []
-        if draw:
+        self.experience_writer = None # if set to an ExperienceWriter, collected data is streamed to it after every round
+        self.game_record = None # if set to a GameRecordWriter, every round played is recorded to it
+        self.stats = None # PhaseStats, when timing is turned on with enable_stats
+        self.frames = None # FramePipeline turns are published to when drawing live
+        if draw == "live":
+            from graphics import start_pipeline # pygame is only loaded when drawing
+            self.frames = start_pipeline()
+        elif draw:
+            from graphics import set_up_graphics
             set_up_graphics()
 
+    def enable_stats(self):
+        """
+            Starts timing the phases of every turn and counting turns, passes and tricks.
+            Returns the PhaseStats, whose snapshot() can be read after games().
+        """
+        self.stats = PhaseStats(self.agents)
+        return self.stats
+
     def incr_player(self, next_player=-1):
         """
             Function that increments the current player when called without arguments.
@@ -107,33 +150,44 @@ class ScumController:
         """
         if next_player >= 0:
             self.curr_player = next_player
+        elif not self.gamestate.top_cards:
+            self.curr_player = (self.curr_player + 1) % self.n # on an empty table out players still get a turn
         else:
-            self.curr_player = (self.curr_player + 1) % self.n
+            # out players facing cards always pass (see Agent.auto_passer), so their turns are skipped,
+            # only marking them as passed like their turn would have
+            gamestate = self.gamestate
+            p = self.curr_player
+            next_player = gamestate.next_active[p]
+            while gamestate.out_mask >> next_player & 1: # p may be out, with a link that went stale since
+                next_player = gamestate.next_active[next_player]
+            p = (p + 1) % self.n
+            while p != next_player:
+                gamestate.passed[p] = True
+                p = (p + 1) % self.n
+            self.curr_player = next_player
 
     def deal_round(self):
         Deck().deal_hands(self.gamestate.hands, self.president)
 
     def trade(self, prev_order):
         """
-            Initiate trading. For now, this trading is just done automatically.
+            Initiate trading. For now, this trading is just done automatically:
+            the president takes the 3 highest cards away from the scum, 2nd and 2nd to last trade 2 times,
+            and 3rd and 3rd to last trade once, each giving back their default_give card.
+            Returns the default_trade result of every trade, in that order.
         """
-        # the president takes the 3 highest cards away from the scum
-        default_trade(self.gamestate.hands[prev_order[0]], self.gamestate.hands[prev_order[-1]])
-        default_trade(self.gamestate.hands[prev_order[0]], self.gamestate.hands[prev_order[-1]])
-        default_trade(self.gamestate.hands[prev_order[0]], self.gamestate.hands[prev_order[-1]])
-
-        # 2nd and 2nd to last trade 2 times
-        default_trade(self.gamestate.hands[prev_order[1]], self.gamestate.hands[prev_order[-2]])
-        default_trade(self.gamestate.hands[prev_order[1]], self.gamestate.hands[prev_order[-2]])
-
-        # 3rd and 3rd to last trade once
-        default_trade(self.gamestate.hands[prev_order[2]], self.gamestate.hands[prev_order[-3]])
+        hands = self.gamestate.hands
+        moves = [] # the cards moved by every trade, in order
+        for pos, times in TRADES:
+            moves += trade_hands(hands[prev_order[pos]], hands[prev_order[-1 - pos]], times)
+        return moves
 
-    def setup_round(self, prev_order=None):
+    def setup_round(self, prev_order=None, deck=None):
         """
             Sets up the players to play a round by resetting gamestate,
             dealing cards, simulating trading.
             if prev_order is None, this function will act as if it is the first round.
+            if deck is given, it is dealt instead of a freshly shuffled Deck.
         """
         self.gamestate.reset()
 
@@ -147,11 +201,17 @@ class ScumController:
         self.curr_player = self.president
 
         # deal hands starting at the president
-        Deck().deal_hands(self.gamestate.hands, self.president)
+        if deck is None:
+            deck = Deck()
+        deck.deal_hands(self.gamestate.hands, self.president)
+        if self.game_record is not None:
+            self.game_record.begin_round(self.president, prev_order, self.gamestate.hands)
 
         # if we have a scum (not first round) initiate trading
         if self.scum != None:
-            self.trade(prev_order)
+            moves = self.trade(prev_order)
+            if self.game_record is not None:
+                self.game_record.trade(moves)
 
     def games(self, n_games, n_rounds):
         """
@@ -162,9 +222,7 @@ class ScumController:
         for g in range(n_games):
             for r in range(n_rounds):
                 scores = self.round(scores, r) # each round's setup depends on the previous round's results
-                self.gamestate.turn_count = 0
-                self.gamestate.rounds_won[self.gamestate.out[0]] += 1
-                self.gamestate.play_order = self.gamestate.out
+                self.finish_round()
                 for i in range(self.n):
                     player_results[scores[i]].append(i)
 
@@ -172,17 +230,31 @@ class ScumController:
             for agent in self.agents:
                 if isinstance(agent, DataCollectingAgent):
                     self.collected_data += agent.data
+                    agent.data = []
 
         # convert player results to a counter
         nice_results = [Counter(result) for result in player_results]
 
         return nice_results
 
-    def round(self, prev_order, round):
+    def finish_round(self):
+        """
+            Updates the round counts and play order shown by the graphics after a round.
+        """
+        self.gamestate.turn_count = 0
+        self.gamestate.rounds_won[self.gamestate.out[0]] += 1
+        self.gamestate.play_order = self.gamestate.out
+
+    def round(self, prev_order, round, deck=None):
         """
-            Run a single round of play given previous ordering prev_order.
+            Run a single round of play given previous ordering prev_order (and optionally the deck to deal).
         """
-        self.setup_round(prev_order)
+        stats = self.stats
+        if stats is not None:
+            t = clock()
+        self.setup_round(prev_order, deck)
+        if stats is not None:
+            stats.lap("setup_round", t)
         MAX_ITER = 1000
         for i in range(MAX_ITER + 1):
             if i == MAX_ITER:
@@ -194,48 +266,129 @@ class ScumController:
 
             scores = self.turn(round)
             if scores != None: # only get a return value if the round is over.
-                # allow the data collecting agents to collect their data
-                for i in range(len(self.agents)):
-                    agent = self.agents[i]
-                    if isinstance(agent, DataCollectingAgent):
-                        agent.finish_round(scores.index(i))
+                self.end_round(scores, i + 1)
                 return scores
 
+    def end_round(self, scores, turns):
+        """
+            Records the round that just ended after turns turns, and lets the agents learn from its scores.
+        """
+        stats = self.stats
+        if stats is not None:
+            stats.end_round(turns)
+            t = clock()
+        if self.game_record is not None:
+            self.game_record.end_round()
+        # allow the data collecting agents to collect their data
+        for i in range(len(self.agents)):
+            agent = self.agents[i]
+            if isinstance(agent, DataCollectingAgent):
+                agent.finish_round(scores.index(i))
+                if self.experience_writer is not None:
+                    self.experience_writer.extend(agent.data)
+                    agent.data = []
+        if stats is not None:
+            stats.lap("finish_round", t)
+
     def turn(self, round):
         """
             Run a single turn of play for the current player
         """
-        view = AgentView(self.gamestate, self.curr_player)
-        action = self.agents[self.curr_player].get_action(view)
+        stats = self.stats
+        if stats is None:
+            view = self.view
+            view.move_to(self.curr_player)
+            action = self.agents[self.curr_player].get_action(view)
+            return self.advance(action, round)
+
+        p = self.curr_player
+        t = clock()
+        view = self.view
+        view.move_to(p)
+        t = stats.lap("AgentView", t)
+        action = self.agents[p].get_action(view)
+        stats.lap(stats.action_phases[p], t)
+        stats.count("turns")
+        if not isinstance(action, tuple):
+            stats.count("passes")
+            top_cards = view.top_cards
+            if top_cards and compute_playable(view.hand)[len(top_cards) - 1] < top_cards[0].rank():
+                stats.count("auto_passes") # the same test as Agent.auto_passer
+        return self.advance(action, round)
+
+    def advance(self, action, round):
+        """
+            Plays action for the current player, and moves the game on to the next turn.
+            Returns the final order of going out if the round is over, and None otherwise.
+        """
+        if self.game_record is not None:
+            self.game_record.action(action)
+        stats = self.stats
+        if stats is not None:
+            t = clock()
+        p = self.curr_player
+        waiting = not self.gamestate.passed[p] and not self.gamestate.out_mask >> p & 1
         if self.play(action) == "Pass":
-            self.gamestate.passed[self.curr_player] = True
+            if waiting:
+                self.gamestate.waiting -= 1
+            self.gamestate.passed[p] = True
+        if stats is not None:
+            stats.lap("play", t)
 
         if self.draw:
-            draw_graphics(round, self.curr_player, action, self.gamestate)
+            self.show(round, action)
+
+        if stats is None:
+            return self.next_turn(round)
+        t = clock()
+        scores = self.next_turn(round)
+        stats.lap("trick_end", t)
+        return scores
 
+    def next_turn(self, round):
+        """
+            Ends the round if all but one player is out, and otherwise moves play to the next player,
+            clearing the table if everyone has passed since the last play.
+        """
+        gamestate = self.gamestate
         # test for end of game
-        if len(self.gamestate.out) >= self.n - 1: # are all but 1 players out?
+        if len(gamestate.out) >= self.n - 1: # are all but 1 players out?
             # add the last player to the end of out
-            for p in range(self.n):
-                if p not in self.gamestate.out:
-                    self.gamestate.out.append(p)
-                    return self.gamestate.out # final scores is the order of going out
-
-        if all(self.gamestate.passed[i] or i in self.gamestate.out for i in range(self.n)): # all players have passed or out, move play to the last_player to lead.
-            self.gamestate.passed = [False] * self.n  # reset passed list
-            if self.gamestate.last_player not in self.gamestate.out:
-                self.incr_player(self.gamestate.last_player)
+            remaining = ((1 << self.n) - 1) & ~gamestate.out_mask
+            gamestate.go_out(remaining.bit_length() - 1)
+            return gamestate.out # final scores is the order of going out
+
+        if not gamestate.waiting: # all players have passed or out, move play to the last_player to lead.
+            gamestate.passed = [False] * self.n  # reset passed list
+            gamestate.waiting = self.n - len(gamestate.out)
+            if not gamestate.out_mask >> gamestate.last_player & 1:
+                self.incr_player(gamestate.last_player)
             else:
-                while self.curr_player in self.gamestate.out:
-                    self.incr_player()
-            self.gamestate.top_cards = [] # reset top cards
+                while gamestate.out_mask >> self.curr_player & 1: # the first player still in after the one who went out
+                    self.curr_player = gamestate.next_active[self.curr_player]
+            gamestate.top_cards = [] # reset top cards
+            if self.stats is not None:
+                self.stats.count("tricks")
 
             if self.draw:
-                draw_graphics(round, self.curr_player, "WIN", self.gamestate)
+                self.show(round, "WIN")
             self.gamestate.turn_count += 1
         else: # otherwise, increment player normally
             self.incr_player()
 
+    def show(self, round, action):
+        """
+            Draws the current player's turn, or publishes it to the window when drawing live.
+        """
+        if self.frames is not None:
+            from graphics import Frame
+            frame = Frame(round, self.curr_player, action, self.gamestate)
+            if frame.shown():
+                self.frames.publish(frame)
+        else:
+            from graphics import draw_graphics
+            draw_graphics(round, self.curr_player, action, self.gamestate)
+
     def play(self, action):
         if isinstance(action, tuple):
             if not set(action) <= set(self.gamestate.hands[self.curr_player].cards): # skip move if the cards aren't in the players hand
@@ -252,10 +405,10 @@ class ScumController:
 
             self.gamestate.top_cards = action # update the top cards
             self.gamestate.last_player = self.curr_player
-            self.gamestate.cards_seen += action # mark the cards as seen
+            self.gamestate.cards_seen.add(action) # mark the cards as seen
             self.gamestate.hands[self.curr_player].remove(action) # remove the cards from that players hand
             if not self.gamestate.hands[self.curr_player]: # is the player's hand now empty...
-                self.gamestate.out.append(self.curr_player)
+                self.gamestate.go_out(self.curr_player)
             option = "Not Passed"
         option = "Pass"
 
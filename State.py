@@ -6,33 +6,140 @@
     and actions as integers.
 """
 import random
+from collections import namedtuple
+import numpy as np
 from Cards import CARD_STRS, Deck, Hand, Card
-from collections import Counter
-from itertools import combinations_with_replacement
 
-num_hand = {0 : ()}
-acc = 1
-for i in range(1, 6):
-    # add all combinations of i-card hands to num_hand
-    tuples = list(enumerate(combinations_with_replacement(range(2, 15), i)))
-    num_hand.update({n + acc : hand for n, hand in tuples})
-    acc += len(tuples) # acc accumulate the sizes of the smaller dictionaries
+# Hands are encoded by their (up to) 5 highest ranks, as a multiset of rank indices 0-12.
+# Hands are numbered by size, and within a size in the lexicographic order of
+# itertools.combinations_with_replacement, with the empty hand as 0.
+#
+# A sorted multiset c_1 <= ... <= c_k of ranks is the same as the set d_j = c_j + j - 1
+# of k distinct values below 12 + k, so by the combinatorial number system its position is
+#     C(12 + k, k) - 1 - sum_j C(11 + k - d_j, k - j + 1)
+MAX_HAND = 5
+BINOM = [[0] * (MAX_HAND + 2) for _ in range(13 + MAX_HAND)] # BINOM[n][k] = n choose k
+for n in range(13 + MAX_HAND):
+    BINOM[n][0] = 1
+    for k in range(1, MAX_HAND + 2):
+        BINOM[n][k] = BINOM[n - 1][k - 1] + BINOM[n - 1][k] if n else 0
 
-hand_num = {v : k  for k, v in num_hand.items()}
+HAND_OFFSETS = [0, 1] # HAND_OFFSETS[k] is the number of the first hand of size k
+for k in range(1, MAX_HAND + 1):
+    HAND_OFFSETS.append(HAND_OFFSETS[-1] + BINOM[12 + k][k])
+N_HANDS = HAND_OFFSETS[-1]
+BINOM_ARRAY = np.array(BINOM, dtype=np.int64)
+
+
+def hand_index(counts, size):
+    """
+        The number of the hand with the given rank counts (as Hand.rank_counts) and size,
+        keeping only its MAX_HAND highest cards.
+    """
+    k = min(size, MAX_HAND)
+    if not k:
+        return 0
+    index = HAND_OFFSETS[k] + BINOM[12 + k][k] - 1
+    j = k # position of the next card in ascending order, filled from the highest card down
+    for i in range(12, -1, -1):
+        c = counts[i]
+        while c:
+            index -= BINOM[12 + k - i - j][k - j + 1] # C(11 + k - d_j, k - j + 1) with d_j = i + j - 1
+            j -= 1
+            if not j:
+                return index
+            c -= 1
+    return index
+
+
+def hand_index_many(counts):
+    """
+        hand_index of every row of an (n x 13) array of rank counts.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    k = np.minimum(counts.sum(axis=1), MAX_HAND)
+    index = np.array(HAND_OFFSETS, dtype=np.int64)[k] + BINOM_ARRAY[12 + k, k] - 1
+    above = np.cumsum(counts[:, ::-1], axis=1) # above[:, t] counts the cards of rank index 12 - t or higher
+    for t in range(MAX_HAND): # the t-th highest card
+        i = 12 - (above <= t).sum(axis=1) # its rank index
+        j = k - t
+        has = j > 0
+        index -= np.where(has, BINOM_ARRAY[np.clip(12 + k - i - j, 0, len(BINOM) - 1), np.clip(k - j + 1, 0, MAX_HAND + 1)], 0)
+    index[k == 0] = 0
+    return index
+
+
+def index_hand(index):
+    """
+        The inverse of hand_index, returns the sorted list of ranks (2-14) of the hand numbered index.
+    """
+    k = 0
+    while index >= HAND_OFFSETS[k + 1]:
+        k += 1
+    r = index - HAND_OFFSETS[k]
+    ranks = []
+    d = 0 # smallest value the next d_j can take
+    for j in range(1, k + 1):
+        while r >= BINOM[11 + k - d][k - j]: # hands with d_j = d come first, skip them
+            r -= BINOM[11 + k - d][k - j]
+            d += 1
+        ranks.append(d - j + 1 + 2)
+        d += 1
+    return ranks
 
 
 class AgentView:
+    """
+        The view of one player of a game. hand and top_cards, which almost every agent reads, are set by move_to,
+        and the other fields are read from the gamestate only when they are asked for.
+        A controller keeps one AgentView and moves it to the player to act every turn,
+        so the view is only valid for the turn it was given on.
+        Agents that keep a view past their turn should keep view.snapshot() instead.
+    """
+    __slots__ = ("gamestate", "player", "hand", "top_cards")
+
     def __init__(self, gamestate, i):
         """
             Initialize the agentview of the ith player in the game given the gamestate
         """
-        self.hand = gamestate.hands[i]
-        self.out = gamestate.out
-        self.hand_lengths = [len(hand) for hand in gamestate.hands]
-        self.cards_seen = gamestate.cards_seen
-        self.top_cards = gamestate.top_cards
-        self.passed = gamestate.passed
-        self.last_player = gamestate.last_player
+        self.gamestate = gamestate
+        self.move_to(i)
+
+    def move_to(self, i):
+        """
+            Makes this the view of the ith player, as the gamestate is now.
+        """
+        self.player = i
+        self.hand = self.gamestate.hands[i]
+        self.top_cards = self.gamestate.top_cards
+
+    @property
+    def out(self):
+        return self.gamestate.out
+
+    @property
+    def hand_lengths(self):
+        return tuple([len(hand) for hand in self.gamestate.hands])
+
+    @property
+    def cards_seen(self):
+        return self.gamestate.cards_seen
+
+    @property
+    def passed(self):
+        return self.gamestate.passed
+
+    @property
+    def last_player(self):
+        return self.gamestate.last_player
+
+    def snapshot(self):
+        """
+            An immutable copy of the view as it is now, which stays valid after the turn.
+        """
+        gamestate = self.gamestate
+        return ViewSnapshot(self.hand.copy(), tuple(gamestate.out), self.hand_lengths, gamestate.cards_seen.copy(),
+                            tuple(self.top_cards), tuple(gamestate.passed), gamestate.last_player, self.player)
 
     def __str__(self):
         s = "Agent View:\n"
@@ -40,6 +147,14 @@ class AgentView:
         s += "Hand: " + str(self.hand.cards)
         return s
 
+class ViewSnapshot(namedtuple("ViewSnapshot", ["hand", "out", "hand_lengths", "cards_seen", "top_cards", "passed", "last_player", "player"])):
+    """
+        A copy of an AgentView at one turn, made by AgentView.snapshot. Its fields are tuples (and copies of the hand and the seen cards).
+    """
+    __slots__ = ()
+
+    __str__ = AgentView.__str__
+
 class SimpleView:
     def __init__(self, hand, top_cards):
         """
@@ -62,18 +177,26 @@ def int_state(view):
         Cards are encoded such that 1-13 represent the 13 ranks, and 0 represents
         the card not existing
     """
-    ranks = sorted([card.rank() for card in view.hand.cards])
-    ranks = ranks[-5:] # only get the first 5 cards
-
     s = 0
     if view.top_cards:
         s += view.top_cards[0].rank() - 1
         s += 14 * (len(view.top_cards) - 1) # encode the number of cards in the middle
 
-    s += 14 * 4 * hand_num[tuple(ranks)]
+    s += 14 * 4 * hand_index(view.hand.rank_counts, len(view.hand))
 
     return s
 
+def int_state_many(counts, top_rank, top_count):
+    """
+        int_state of many views at once, given as an (n x 13) array of rank counts,
+        the rank index of the top cards (-1 if there are none) and the number of top cards,
+        as in BatchScum.BatchView.
+    """
+    top_rank = np.asarray(top_rank, dtype=np.int64)
+    top_count = np.asarray(top_count, dtype=np.int64)
+    s = np.where(top_count > 0, top_rank + 1 + 14 * (top_count - 1), 0)
+    return s + 14 * 4 * hand_index_many(counts)
+
 def state_int(s):
     """
         Converts an integer back into a (lossy) version of the state
@@ -92,9 +215,7 @@ def state_int(s):
     else:
         s = s // 56
 
-    hand = list(num_hand[s])
-
-
+    hand = index_hand(s)
 
     return (hand, top_cards)
 
@@ -129,26 +250,26 @@ def int_action_space(view):
         Given an agentview, returns a list of all valid actions
         given the state of that game as integers
     """
-    poss_actions = {0}
+    poss_actions = [0]
+    counts = view.hand.rank_counts
     if not view.top_cards:
-        for card in view.hand.cards:
-            poss_actions.add(card.rank() - 1)
+        for i in range(13):
+            if counts[i]:
+                poss_actions.append(i + 1)
     else:
-        ranks = Counter([card.rank() for card in view.hand.cards])
-        for rank, cnt in ranks.items():
-            if cnt >= len(view.top_cards) and rank > view.top_cards[0].rank():
-                poss_actions.add(rank - 1)
+        n = len(view.top_cards)
+        for i in range(view.top_cards[0].rank() - 1, 13): # rank index i is rank i + 2, so start just above the top card
+            if counts[i] >= n:
+                poss_actions.append(i + 1)
 
-    poss_actions = sorted(list(poss_actions))
     return poss_actions
 
 def int_to_action(a, view):
     if a == 0:
         return "Pass"
 
-    ranks = Counter([card.rank() for card in view.hand.cards])
     if not view.top_cards:
-        n = ranks[a + 1]
+        n = view.hand.rank_counts[a - 1]
     else:
         n = len(view.top_cards)
 
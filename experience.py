@@ -0,0 +1,109 @@
+"""
+    This file implements a binary log of (state, action, reward, state_prime) experience.
+
+    A log is a 16 byte header followed by packed records of RECORD, one per tuple.
+    ExperienceWriter buffers records in a fixed size NumPy array and appends it to the file every time
+    it fills up, so memory stays bounded by the chunk size however long data generation runs.
+    ExperienceReader reads a log back chunk by chunk, or memory-maps the whole file.
+"""
+import os
+import struct
+import numpy as np
+
+RECORD = np.dtype([("s", "<i4"), ("a", "<i1"), ("r", "<f4"), ("sp", "<i4")])
+MAGIC = b"SCUMEXP"
+VERSION = 1
+HEADER = struct.Struct("<7sBII") # magic, version, record size, reserved
+HEADER_SIZE = HEADER.size
+
+
+class ExperienceWriter:
+    def __init__(self, path, chunk_size=65536, append=False):
+        """
+            Opens a log at path for writing, keeping at most chunk_size records in memory.
+            With append=True, records are added to the end of an existing log.
+        """
+        self.path = path
+        self.chunk = np.empty(chunk_size, dtype=RECORD)
+        self.n = 0 # records waiting in self.chunk
+        self.written = 0
+        if append and os.path.exists(path):
+            self.written = len(ExperienceReader(path))
+            self.file = open(path, "ab")
+        else:
+            self.file = open(path, "wb")
+            self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.itemsize, 0))
+
+    def append(self, s, a, r, sp):
+        self.chunk[self.n] = (s, a, r, sp)
+        self.n += 1
+        if self.n == len(self.chunk):
+            self.flush()
+
+    def extend(self, data):
+        """
+            Appends every (s, a, r, sp) tuple of data.
+        """
+        for s, a, r, sp in data:
+            self.append(s, a, r, sp)
+
+    def flush(self):
+        if self.n:
+            self.file.write(self.chunk[:self.n].tobytes())
+            self.written += self.n
+            self.n = 0
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __len__(self):
+        return self.written + self.n
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ExperienceReader:
+    def __init__(self, path):
+        """
+            Opens the log at path for reading.
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, record_size, _ = HEADER.unpack(f.read(HEADER_SIZE))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an experience log")
+        if version != VERSION or record_size != RECORD.itemsize:
+            raise ValueError(f"Experience log {path} has version {version} and {record_size} byte records, expected {VERSION} and {RECORD.itemsize}")
+        self.n = (os.path.getsize(path) - HEADER_SIZE) // RECORD.itemsize
+
+    def __len__(self):
+        return self.n
+
+    def chunks(self, chunk_size=65536):
+        """
+            Yields the records in order, as arrays of at most chunk_size records.
+        """
+        with open(self.path, "rb") as f:
+            f.seek(HEADER_SIZE)
+            for start in range(0, self.n, chunk_size):
+                yield np.fromfile(f, dtype=RECORD, count=min(chunk_size, self.n - start))
+
+    def memmap(self):
+        """
+            Maps every record of the log read-only, without reading it into memory.
+        """
+        return np.memmap(self.path, dtype=RECORD, mode="r", offset=HEADER_SIZE, shape=(self.n,))
+
+    def columns(self):
+        """
+            Returns the s, a, r and sp columns of the log as separate arrays.
+        """
+        records = self.memmap()
+        return records["s"], records["a"], records["r"], records["sp"]
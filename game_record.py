@@ -0,0 +1,212 @@
+"""
+    This file implements a compact binary record of played rounds, and a replayer for it.
+
+    A record is a 16 byte header followed by one entry per round:
+        - a 4 byte round header: number of players, president, whether there was trading, number of turns (2 bytes)
+        - the previous round's out order (one byte per player), only if there was trading
+        - the deal: for every card of CARD_STRS, the player it was dealt to (52 bytes)
+        - the trades: for every default_trade call of ScumController.trade, the card the scum gave
+          and the card the president gave back (12 bytes), only if there was trading
+        - one byte per turn: 0 for a pass, otherwise the rank index + 1 in the high nibble
+          and the mask of the suits played (bit i is the card of index 4 * rank + i) in the low nibble
+
+    Everything else about a round follows from the rules, so replay rebuilds the GameState and
+    AgentView of every turn by playing the recorded actions through a ScumController, without any agents.
+"""
+import struct
+from Cards import CARDS
+from ScumController import ScumController
+
+MAGIC = b"SCUMGAME"
+VERSION = 1
+HEADER = struct.Struct("<8sB7x") # magic, version, reserved
+ROUND = struct.Struct("<BBBH") # players, president, traded, turns
+NO_TRADE = 0xFF # trade byte of a player trading with themselves, which moves no cards
+
+
+def encode_action(action):
+    """
+        The byte of an action: 0 for a pass, rank and suit mask for a tuple of cards.
+    """
+    if not isinstance(action, tuple):
+        return 0
+    rank = action[0].index >> 2
+    suits = 0
+    for card in action:
+        suits |= 1 << (card.index & 3)
+    return (rank + 1) << 4 | suits
+
+
+def decode_action(byte):
+    """
+        The inverse of encode_action, the cards of an action are always in card order.
+    """
+    if not byte:
+        return "Pass"
+    base = ((byte >> 4) - 1) << 2
+    return tuple(CARDS[base + i] for i in range(4) if byte >> i & 1)
+
+
+class GameRecordWriter:
+    def __init__(self, path, buffer_size=1 << 20):
+        """
+            Opens a record at path for writing, keeping at most about buffer_size bytes in memory.
+        """
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION))
+        self.buffer = bytearray()
+        self.buffer_size = buffer_size
+        self.rounds = 0
+        self.turns = 0
+        self.round_start = None # (players, president, prev_order, deal) of the round being played
+        self.trades = b""
+        self.actions = bytearray()
+
+    def begin_round(self, president, prev_order, hands):
+        """
+            Records the deal of a round, before trading.
+        """
+        deal = bytearray(len(CARDS))
+        for p, hand in enumerate(hands):
+            m = hand.mask
+            while m:
+                low = m & -m
+                deal[low.bit_length() - 1] = p
+                m ^= low
+        self.round_start = (len(hands), president, prev_order, bytes(deal))
+        self.trades = b""
+        self.actions = bytearray()
+
+    def trade(self, moves):
+        """
+            Records the (scum card, president card) pairs moved by ScumController.trade, None for a trade that moved nothing.
+        """
+        trades = bytearray()
+        for move in moves:
+            if move is None:
+                trades += bytes((NO_TRADE, NO_TRADE))
+            else:
+                trades += bytes((move[0].index, move[1].index))
+        self.trades = bytes(trades)
+
+    def action(self, action):
+        self.actions.append(encode_action(action))
+
+    def end_round(self):
+        """
+            Adds the finished round to the record.
+        """
+        n, president, prev_order, deal = self.round_start
+        self.buffer += ROUND.pack(n, president, prev_order is not None, len(self.actions))
+        if prev_order is not None:
+            self.buffer += bytes(prev_order)
+        self.buffer += deal
+        self.buffer += self.trades
+        self.buffer += self.actions
+        self.rounds += 1
+        self.turns += len(self.actions)
+        self.round_start = None
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.buffer = bytearray()
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class GameRecordReader:
+    def __init__(self, path):
+        """
+            Opens the record at path for reading.
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a game record")
+        if version != VERSION:
+            raise ValueError(f"Game record {path} has version {version}, expected {VERSION}")
+
+    def rounds(self):
+        """
+            Yields (n, president, prev_order, deal, trades, actions) for every round, as bytes.
+            prev_order and trades are None for rounds without trading.
+        """
+        with open(self.path, "rb") as f:
+            f.seek(HEADER.size)
+            while True:
+                head = f.read(ROUND.size)
+                if not head:
+                    return
+                if len(head) < ROUND.size:
+                    raise ValueError(f"Game record {self.path} ends in the middle of a round")
+                n, president, traded, n_turns = ROUND.unpack(head)
+                prev_order = f.read(n) if traded else None
+                deal = f.read(len(CARDS))
+                trades = f.read(12) if traded else None
+                actions = f.read(n_turns)
+                if len(actions) < n_turns:
+                    raise ValueError(f"Game record {self.path} ends in the middle of a round")
+                yield n, president, prev_order, deal, trades, actions
+
+
+def replay(path):
+    """
+        Replays a record, yielding (round, gamestate, view, action) before every recorded turn is played,
+        where view is the AgentView the player had when choosing action.
+        Like the views agents get, gamestate and view are only valid until the next turn is played.
+    """
+    controller = None
+    for r, (n, president, prev_order, deal, trades, actions) in enumerate(GameRecordReader(path).rounds()):
+        if controller is None:
+            controller = ScumController([None] * n)
+            view = controller.view
+        gamestate = controller.gamestate
+        gamestate.reset()
+        controller.president = president
+        controller.curr_player = president
+        for card, p in zip(CARDS, deal):
+            gamestate.hands[p].get(card)
+
+        if trades is not None:
+            controller.scum = prev_order[-1]
+            for k in range(0, len(trades), 2):
+                if trades[k] == NO_TRADE:
+                    continue
+                pres, scum = trade_pair(prev_order, k // 2)
+                scum_give, pres_give = CARDS[trades[k]], CARDS[trades[k + 1]]
+                gamestate.hands[pres].get(scum_give)
+                gamestate.hands[scum].remove(scum_give)
+                gamestate.hands[pres].remove(pres_give)
+                gamestate.hands[scum].get(pres_give)
+
+        scores = None
+        for byte in actions:
+            action = decode_action(byte)
+            view.move_to(controller.curr_player)
+            yield r, gamestate, view, action
+            scores = controller.advance(action, r)
+        if scores is None:
+            raise ValueError(f"Round {r} of game record {path} ends before the round is over")
+        controller.finish_round()
+
+
+def trade_pair(prev_order, k):
+    """
+        The (president, scum) players of the kth default_trade call of ScumController.trade.
+    """
+    pos = (0, 0, 0, 1, 1, 2)[k]
+    return prev_order[pos], prev_order[-1 - pos]
@@ -1,5 +1,8 @@
 import pygame
 import time
+import queue
+import threading
+from Cards import CARD_STRS
 
 # Margins
 MARGIN_LEFT = 230
@@ -17,24 +20,69 @@ DARK_GREEN = (10, 90, 7)
 RED = (203, 16, 16)
 BLUE = (44, 109, 238)
 
-pygame.init()
-
-# Setting up the screen and background
-# Types of fonts to be used
-small_font = pygame.font.Font(None, 32)
-large_font = pygame.font.Font(None, 50)
+# Types of fonts to be used, created by set_up_graphics so importing this file doesn't start pygame
+small_font = None
+large_font = None
 
 screen = None
 
+# Regions of the screen, each redrawn and updated only when what it shows changes
+PLAYERS_RECT = (0, 0, WIDTH, 355)
+TABLE_RECT = (0, 355, WIDTH, 395)
+HAND_RECT = (0, 750, WIDTH, HEIGHT - 750)
+
+# Sizes of the card images on the table and in player one's hand
+TABLE_CARD = (100, 160)
+HAND_CARD = (70, 112)
+
+atlas = {} # (image file, size) -> image loaded and scaled once by load_atlas
+text_cache = {} # (font, text, color) -> rendered text surface
+drawn = {} # region rect -> what it shows, to skip regions that haven't changed
+
 def set_up_graphics():
-    global screen
+    global screen, small_font, large_font
+    pygame.init()
+    small_font = pygame.font.Font(None, 32)
+    large_font = pygame.font.Font(None, 50)
+
+    # Setting up the screen and background
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    load_atlas()
+    drawn.clear()
     screen.fill(GREEN)
 
     # Setting up caption
     pygame.display.set_caption("Scum")
     pygame.display.update()
 
+def load_atlas():
+    """
+        Loads the avatar and every card image from disk once, scaled to every size they are drawn at.
+    """
+    if atlas:
+        return
+    atlas["avatar.jpg", (75, 75)] = pygame.transform.scale(pygame.image.load(r'./' + 'avatar.jpg'), (75, 75))
+    for file in translate_for_graphics(CARD_STRS):
+        image = pygame.image.load(r'./cards/' + file)
+        for size in (TABLE_CARD, HAND_CARD):
+            atlas[file, size] = pygame.transform.scale(image, size)
+
+def render_text(font, text, color):
+    """
+        Renders text once, and returns the cached surface on later calls.
+    """
+    key = (font, text, color)
+    surface = text_cache.get(key)
+    if surface is None:
+        surface = font.render(text, True, color)
+        text_cache[key] = surface
+    return surface
+
+def blit_centered(text, center, rect=None):
+    text_rect = rect or text.get_rect()
+    text_rect.center = center
+    screen.blit(text, text_rect)
+
 def translate_for_graphics(action):
     res = []
     for a in action:
@@ -80,14 +128,79 @@ def get_speed(tick_speed):
 
     return time_sleep
         
+class Frame:
+    """
+        A snapshot of everything draw_frame shows for one turn, copied out of the gamestate
+        so it can be drawn later, on another thread, while the game goes on.
+    """
+    def __init__(self, round, player, action, gamestate):
+        time_arr = get_speed(gamestate.tick_speed)
+        self.sleep = time_arr[0]
+
+        self.scum = -1
+        if gamestate.n - len(gamestate.out) == 1:
+            for i in range(gamestate.n):
+                if i not in gamestate.out:
+                    self.scum = i
+                    self.sleep = time_arr[2]
+                    break
+
+        if action == "WIN":
+            self.sleep = time_arr[1]
+
+        self.shown_action = action
+        if action == "Pass" or action == "WIN":
+            self.shown_action = gamestate.last_action
+        gamestate.last_action = self.shown_action
+
+        self.round = round
+        self.player = player
+        self.action = action
+        self.n = gamestate.n
+        self.out = tuple(gamestate.out)
+        self.play_order = tuple(gamestate.play_order)
+        self.rounds_won = tuple(gamestate.rounds_won)
+        self.hand_lengths = tuple(len(hand) for hand in gamestate.hands)
+        self.hand = tuple(gamestate.hands[0].cards) # player one's hand
+        self.turn_count = gamestate.turn_count
+
+    def shown(self):
+        """
+            Nothing is shown for the turns of players who are out, until only the scum is left.
+        """
+        return self.player not in self.out or self.scum != -1
+
 def draw_graphics(round, player, action, gamestate):
-    global screen
+    """
+        Draws the turn right away, and waits for the tick speed delay.
+    """
     pygame.event.get()
-
-    time_arr = get_speed(gamestate.tick_speed)
-    time_sleep = time_arr[0]
-
-    # Draw other player's indicator
+    frame = Frame(round, player, action, gamestate)
+    if frame.shown():
+        draw_frame(frame)
+        time.sleep(frame.sleep)
+
+def draw_frame(frame):
+    """
+        Draws a Frame, redrawing and updating only the regions of the screen that changed.
+    """
+    pygame.event.get()
+    players = (frame.play_order, frame.out, frame.scum, frame.rounds_won, frame.hand_lengths)
+    table = (frame.round, frame.player, frame.action, frame.turn_count, frame.shown_action)
+    dirty = []
+    for rect, key, draw in ((PLAYERS_RECT, players, draw_players), (TABLE_RECT, table, draw_table), (HAND_RECT, frame.hand, draw_hand)):
+        if drawn.get(rect) != key:
+            draw(frame)
+            drawn[rect] = key
+            dirty.append(rect)
+
+    if dirty:
+        pygame.display.update(dirty)
+
+def draw_players(frame):
+    """
+        Draws the overview of the players at the top of the screen.
+    """
     pygame.draw.rect(screen, DARK_GREEN, (0,0,WIDTH,350))
     pygame.draw.line(screen, RED, (0, 350), (WIDTH, 350))
     pygame.draw.line(screen, BLACK, (0, 351), (WIDTH, 351))
@@ -95,116 +208,60 @@ def draw_graphics(round, player, action, gamestate):
     pygame.draw.line(screen, BLACK, (0, 353), (WIDTH, 353))
     pygame.draw.line(screen, RED, (0, 354), (WIDTH, 354))
 
+    blit_centered(render_text(small_font, "Overview of Players", WHITE), (WIDTH//2, 50))
 
-    text = small_font.render("Overview of Players", True, WHITE)
-    text_rect = text.get_rect()
-    text_rect.center = (WIDTH//2, 50)
-    screen.blit(text, text_rect)
+    start = WIDTH//2 - 85 * (frame.n // 2)
+    blit_centered(render_text(small_font, "Play Order:", WHITE), (start-150, 185))
+    blit_centered(render_text(small_font, "Rounds Won:", WHITE), (start-150, 250))
+    blit_centered(render_text(small_font, "Cards Remaining:", WHITE), (start-150, 300))
 
-    scum = -1
-    if gamestate.n - len(gamestate.out) == 1:
-        for i in range(gamestate.n):
-            if i not in gamestate.out:
-                scum = i
-                time_sleep = time_arr[2]
-                break
-    
     offset = 0
-    start = WIDTH//2 - 85 * (gamestate.n // 2)
-    for i in gamestate.play_order:
-        c = pygame.image.load(r'./' + 'avatar.jpg')
-        c = pygame.transform.scale(c , (75,75))
-        screen.blit(c, (start-30+offset, 155))
-
-        num_text = small_font.render(str(i+1), True, BLACK)
-        num_text_rect = num_text.get_rect()
-        num_text_rect.center = (start+10+offset, 185)
-        screen.blit(num_text, num_text_rect)
-
-        play_order_text = small_font.render("Play Order:", True, WHITE)
-        play_order_rect = play_order_text.get_rect()
-        play_order_rect.center = (start-150, 185)
-        screen.blit(play_order_text, play_order_rect)
-
-        rounds_won_text = small_font.render("Rounds Won:", True, WHITE)
-        rounds_won_text_rect = rounds_won_text.get_rect()
-        rounds_won_text_rect.center = (start-150, 250)
-        screen.blit(rounds_won_text, rounds_won_text_rect)
-
-        hands_rem_text = small_font.render("Cards Remaining:", True, WHITE)
-        hands_rem_text_rect = hands_rem_text.get_rect()
-        hands_rem_text_rect.center = (start-150, 300)
-        screen.blit(hands_rem_text, hands_rem_text_rect)
-
-        if i in gamestate.out:
-            place = large_font.render(str(gamestate.out.index(i)+1), True, BLUE)
-            place_rect = place.get_rect()
-            place_rect.center = (start+10+offset, 135)
-            screen.blit(place, place_rect)
-        elif scum != -1 and i == scum:
-            place = large_font.render(str(len(gamestate.out)+1), True, RED)
-            place_rect = place.get_rect()
-            place_rect.center = (start+10+offset, 135)
-            screen.blit(place, place_rect)
-
-        rounds = large_font.render(str(gamestate.rounds_won[i]), True, WHITE)
-        rounds_rect = rounds.get_rect()
-        rounds_rect.center = (start+10+offset, 250)
-        screen.blit(rounds, rounds_rect)
-
-        cards = large_font.render(str(len(gamestate.hands[i].cards)), True, WHITE)
-        cards_rect = rounds.get_rect()
-        cards_rect.center = (start+10+offset, 300)
-        screen.blit(cards, cards_rect)
+    avatar = atlas["avatar.jpg", (75, 75)]
+    for i in frame.play_order:
+        screen.blit(avatar, (start-30+offset, 155))
+        blit_centered(render_text(small_font, str(i+1), BLACK), (start+10+offset, 185))
 
-        offset+=95
+        if i in frame.out:
+            blit_centered(render_text(large_font, str(frame.out.index(i)+1), BLUE), (start+10+offset, 135))
+        elif frame.scum != -1 and i == frame.scum:
+            blit_centered(render_text(large_font, str(len(frame.out)+1), RED), (start+10+offset, 135))
+
+        rounds = render_text(large_font, str(frame.rounds_won[i]), WHITE)
+        blit_centered(rounds, (start+10+offset, 250))
+        cards = render_text(large_font, str(frame.hand_lengths[i]), WHITE)
+        blit_centered(cards, (start+10+offset, 300), rounds.get_rect())
 
-    # Draw the table with cards
-    round_text = small_font.render("Round "+str(round+1), True, BLACK)
-    round_text_rect = round_text.get_rect()
-    round_text_rect.center = (WIDTH//2, HEIGHT//2 - 120)
-    screen.blit(round_text, round_text_rect)
+        offset+=95
 
-    player_text = small_font.render("Player "+str(player+1), True, BLACK)
-    player_text_rect = player_text.get_rect()
-    player_text_rect.center = (WIDTH//2, HEIGHT//2 - 90)
-    screen.blit(player_text, player_text_rect)
+def draw_table(frame):
+    """
+        Draws the current round, player and action, and the cards on the table.
+    """
+    pygame.draw.rect(screen, GREEN, TABLE_RECT)
+    blit_centered(render_text(small_font, "Round "+str(frame.round+1), BLACK), (WIDTH//2, HEIGHT//2 - 120))
+    blit_centered(render_text(small_font, "Player "+str(frame.player+1), BLACK), (WIDTH//2, HEIGHT//2 - 90))
 
     ac = ""
-    if action == 'Pass':
+    if frame.action == 'Pass':
         ac = "Passed"
-    elif action == "WIN":
+    elif frame.action == "WIN":
         ac = "Won this turn"
-        time_sleep = time_arr[1]
     else:
-        ac = ' & '.join([str(a) for a in action])
-
-    hand_text = small_font.render("Action: " + ac, True, BLACK)
-    hand_text_rect = hand_text.get_rect()
-    hand_text_rect.center = (WIDTH//2, HEIGHT//2 - 60)
-    screen.blit(hand_text, hand_text_rect)
-
-    turn_text = small_font.render("Turn: " + str(gamestate.turn_count), True, BLACK)
-    turn_text_rect = turn_text.get_rect()
-    turn_text_rect.center = (WIDTH//2, HEIGHT//2 - 30)
-    screen.blit(turn_text, turn_text_rect)
-
-    if action == "Pass" or action == "WIN":
-        action = gamestate.last_action
+        ac = ' & '.join([str(a) for a in frame.action])
+    blit_centered(render_text(small_font, "Action: " + ac, BLACK), (WIDTH//2, HEIGHT//2 - 60))
+    blit_centered(render_text(small_font, "Turn: " + str(frame.turn_count), BLACK), (WIDTH//2, HEIGHT//2 - 30))
 
     offset = 0
-    if action != "Pass":
-        start = WIDTH//2 - 115 * (len(action) // 2)
-        for file in translate_for_graphics(action):
-            c = pygame.image.load(r'./cards/' + file)
-            c = pygame.transform.scale(c , (100,160))
-            screen.blit(c, (start+offset, HEIGHT//2 + 30))
+    if frame.shown_action != "Pass":
+        start = WIDTH//2 - 115 * (len(frame.shown_action) // 2)
+        for file in translate_for_graphics(frame.shown_action):
+            screen.blit(atlas[file, TABLE_CARD], (start+offset, HEIGHT//2 + 30))
             offset+=120
 
-    gamestate.last_action = action
-
-
-    # Draw Player One's Hand
+def draw_hand(frame):
+    """
+        Draws player one's hand at the bottom of the screen.
+    """
     pygame.draw.line(screen, RED, (0, 750), (WIDTH, 750))
     pygame.draw.line(screen, BLACK, (0, 751), (WIDTH, 751))
     pygame.draw.line(screen, BLACK, (0, 752), (WIDTH, 752))
@@ -213,24 +270,122 @@ def draw_graphics(round, player, action, gamestate):
 
     pygame.draw.rect(screen, DARK_GREEN, (0,754,WIDTH,1000))
 
-    player_one_text = small_font.render("Player One's Hand: ", True, WHITE)
-    player_one_rect = player_one_text.get_rect()
-    player_one_rect.center = (WIDTH//2, HEIGHT//2 + 300)
-    screen.blit(player_one_text, player_one_rect)
+    blit_centered(render_text(small_font, "Player One's Hand: ", WHITE), (WIDTH//2, HEIGHT//2 + 300))
 
     offset = 0
-    start = WIDTH//2 - 75 * (len(gamestate.hands[0].cards) // 2)
-    for file in translate_for_graphics(gamestate.hands[0].cards):
-        c = pygame.image.load(r'./cards/' + file)
-        c = pygame.transform.scale(c , (70,112))
-        screen.blit(c, (start+offset, HEIGHT//2 + 350))
+    start = WIDTH//2 - 75 * (len(frame.hand) // 2)
+    for file in translate_for_graphics(frame.hand):
+        screen.blit(atlas[file, HAND_CARD], (start+offset, HEIGHT//2 + 350))
         offset+=80
 
 
-    if player not in gamestate.out or scum != -1:
-        pygame.display.update()
-        time.sleep(time_sleep)
-    screen.fill(GREEN)
+class FramePipeline:
+    """
+        Hands frames from the game to the window, so the game never waits on the display.
+
+        SDL only allows the window and its events on the main thread (on macOS it crashes otherwise),
+        so pygame stays on the main thread, which renders, and the game is played on a worker thread
+        (see run_live). The game publishes a Frame every turn into a bounded queue and carries on.
+        The renderer shows the newest waiting frame for its tick speed delay, and skips the frames in between,
+        so when it falls behind it drops frames instead of slowing the game down.
+    """
+    def __init__(self, max_frames=8):
+        self.frames = queue.Queue(max_frames)
+        self.dropped = 0 # frames published but never drawn, counted by both threads under lock
+        self.lock = threading.Lock()
+        self.drawn = 0
+
+    def publish(self, frame):
+        """
+            Queues frame to be drawn, dropping the oldest waiting frame if the queue is full. Never blocks.
+        """
+        while True:
+            try:
+                self.frames.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                    with self.lock:
+                        self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def render(self):
+        """
+            Draws the published frames until close is called. Runs on the main thread, once set_up_graphics has been called.
+        """
+        done = False
+        while not done:
+            try:
+                frame = self.frames.get(timeout=0.05)
+            except queue.Empty:
+                pygame.event.get() # keep the window responsive while the game is between frames
+                continue
+
+            while True: # coalesce: only the newest waiting frame is drawn
+                try:
+                    newer = self.frames.get_nowait()
+                except queue.Empty:
+                    break
+                if newer is None:
+                    done = True
+                    break
+                if frame is not None:
+                    with self.lock:
+                        self.dropped += 1
+                frame = newer
+
+            if frame is None:
+                break
+            draw_frame(frame)
+            self.drawn += 1
+            time.sleep(frame.sleep)
+
+    def close(self):
+        """
+            Stops render once it has shown the last published frame.
+        """
+        self.publish(None)
+
+
+pipeline = None
+
+def start_pipeline():
+    """
+        The FramePipeline every live controller publishes to, which run_live renders.
+    """
+    global pipeline
+    if pipeline is None:
+        pipeline = FramePipeline()
+    return pipeline
+
+def run_live(play):
+    """
+        Calls play() on a game thread while the main thread draws the frames its live controllers publish.
+        Once play has finished and its last frame is shown, closes the window and returns what play returned,
+        or raises what it raised. Has to be called from the main thread.
+    """
+    global pipeline
+    frames = start_pipeline()
+    set_up_graphics()
+    outcome = {}
+    def game():
+        try:
+            outcome["result"] = play()
+        except BaseException as error:
+            outcome["error"] = error # raised again on the main thread
+        finally:
+            frames.close()
+    thread = threading.Thread(target=game, name="game", daemon=True)
+    thread.start()
+    frames.render()
+    thread.join()
+    pipeline = None
+    pygame.quit()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("result")
 
 def quit_pygame():
-    pygame.quit()
\ No newline at end of file
+    pygame.quit()
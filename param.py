@@ -3,13 +3,145 @@
     which uses a parametric version of the state / action pair to
     directly evaluate possibilities.
 """
-from river import linear_model
 from State import int_action_space
 import numpy as np
+import math
 from random import shuffle, random, choice
 
+FEATURES = ["like_baseline", "action", "Out Count", "Top Card Rank", "Top Card Count"]
+
+def run_steps(steps):
+    """
+        Runs an action generator (like ParamModel.get_action_steps) on its own, answering every
+        request (function, item) it yields with function([item])[0], and returns its action.
+    """
+    try:
+        request = next(steps)
+        while True:
+            function, item = request
+            request = steps.send(function([item])[0])
+    except StopIteration as stop:
+        return stop.value
+
+def feature_layout(n):
+    """
+        The keys of the features built by ParamModel.X for an n player game, in column order:
+        the named features, then the hand lengths, passes, and a one hot of the last player (always 7 wide).
+    """
+    return FEATURES + list(range(2 * n + 7))
+
+def feature_matrix(view, actions):
+    """
+        Builds the features of ParamModel.X for every action in actions at once,
+        as a (len(actions) x len(feature_layout(n))) array.
+    """
+    all_actions = int_action_space(view)
+    baseline = all_actions[1] if len(all_actions) > 1 else all_actions[0]
+
+    one_hot = [0] * 7
+    if view.last_player < 7:
+        one_hot[view.last_player] = 1
+    row = np.array([0, 0, len(view.out), view.top_cards[0].rank()-1 if view.top_cards else 0, len(view.top_cards)]
+                   + list(view.hand_lengths) + list(view.passed) + one_hot, dtype=float)
+    X = np.repeat(row[None, :], len(actions), axis=0) # everything but the first two columns is shared by the actions
+    X[:, 1] = actions
+    X[:, 0] = X[:, 1] == baseline
+    return X
+
+def sigmoid(z):
+    """
+        river's sigmoid, which saturates to exactly 0 and 1 past +-30.
+    """
+    if z < -30:
+        return 0
+    if z > 30:
+        return 1
+    return 1 / (1 + math.exp(-z))
+
+def schedule_rate(schedule):
+    """
+        river stores learning rates as schedulers, this gets the (constant) rate out of one.
+    """
+    return schedule.get(0) if hasattr(schedule, "get") else float(schedule)
+
+class BatchTrainer():
+    """
+        A NumPy logistic regression with the same loss, learning rates, L2 penalty and gradient clipping
+        as river's LogisticRegression, trained with mini-batch SGD.
+
+        Feature rows (in feature_layout order) are buffered into a preallocated array,
+        and every step applies the whole buffer at once. The gradients of the batch are summed,
+        not averaged, so each row moves the weights as much as a learn_one call on it would.
+    """
+    def __init__(self, layout, batch_size=256, lr=0.01, intercept_lr=0.01, l2=0.0, clip_gradient=1e12):
+        self.layout = layout
+        self.w = np.zeros(len(layout))
+        self.intercept = 0.0
+        self.lr = lr
+        self.intercept_lr = intercept_lr
+        self.l2 = l2
+        self.clip_gradient = clip_gradient
+        self.X = np.empty((batch_size, len(layout)))
+        self.y = np.empty(batch_size)
+        self.n = 0 # rows waiting in the buffer
+
+    @classmethod
+    def from_river(cls, model, layout, batch_size=256):
+        """
+            Builds a trainer with the weights and hyperparameters of a river LogisticRegression.
+        """
+        trainer = cls(layout, batch_size, lr=model.optimizer.learning_rate, intercept_lr=schedule_rate(model.intercept_lr),
+                      l2=model.l2, clip_gradient=model.clip_gradient)
+        weights = model.weights
+        trainer.w[:] = [weights.get(k, 0.0) for k in layout]
+        trainer.intercept = float(model.intercept)
+        return trainer
+
+    def to_river(self, model):
+        """
+            Writes the trainer's weights back into a river LogisticRegression.
+        """
+        for k, w in zip(self.layout, self.w.tolist()):
+            model._weights[k] = w # river only exposes a copy of its weights, so set them on the underlying VectorDict
+        model.intercept = float(self.intercept)
+
+    def learn_many(self, X, y):
+        """
+            Buffers the rows of X with labels y, stepping every time the buffer fills up.
+        """
+        i = 0
+        while i < len(X):
+            k = min(len(X) - i, len(self.X) - self.n)
+            self.X[self.n:self.n + k] = X[i:i + k]
+            self.y[self.n:self.n + k] = y[i:i + k] if np.ndim(y) else y
+            self.n += k
+            i += k
+            if self.n == len(self.X):
+                self.step()
+
+    def step(self):
+        """
+            Applies one SGD step with the buffered rows, and empties the buffer.
+        """
+        if not self.n:
+            return
+        X, y = self.X[:self.n], self.y[:self.n]
+        sign = np.where(y == 0, -1.0, 1.0) # Log loss maps {0, 1} to {-1, 1}
+        z = np.clip(sign * (X @ self.w + self.intercept), -500, 500)
+        loss_gradient = np.clip(-sign / (np.exp(z) + 1.0), -self.clip_gradient, self.clip_gradient)
+
+        self.intercept -= self.intercept_lr * loss_gradient.sum()
+        self.w -= self.lr * (loss_gradient @ X + self.n * self.l2 * self.w)
+        self.n = 0
+
 class ParamModel():
+    _weights = None # (n, weight vector, intercept) exported from the river model, None when stale
+    trainer = None # BatchTrainer, when training in mini-batches (see use_batch_training)
+    batch_size = None
+    every_round = True
+
     def __init__(self, exploration=0.1, alpha=1):
+        from river import linear_model # river is slow to import, so only load it when a model is made
         self.model = linear_model.LogisticRegression()
         self.exploration = exploration
         self.alpha = alpha
@@ -27,10 +159,19 @@ class ParamModel():
             "Top Card Rank" : view.top_cards[0].rank()-1 if view.top_cards else 0,
             "Top Card Count" : len(view.top_cards)
         }
-        X.update(dict(enumerate(view.hand_lengths + view.passed + [1 if i == view.last_player else 0 for i in range(7)])))
+        X.update(dict(enumerate(list(view.hand_lengths) + list(view.passed) + [1 if i == view.last_player else 0 for i in range(7)])))
         return X
 
     def get_action(self, view):
+        return run_steps(self.get_action_steps(view))
+
+    def get_action_steps(self, view):
+        """
+            Chooses the action for view as a generator: instead of scoring the actions itself, it yields the request
+            (self.logits_many, (n, features of the actions)) and is sent back their logits,
+            so the requests of many tables can be scored together (see MultiTableRunner.py).
+            get_action runs it on its own.
+        """
         actions = int_action_space(view)
 
         if len(actions) == 1:
@@ -39,20 +180,98 @@ class ParamModel():
         if random() < self.exploration:
             return choice(actions)
 
-        curr_action = None
-        curr_p = -1
         shuffle(actions)
-        for a in actions[1:]:
-            X = self.X(view, a)
-            p = self.model.predict_proba_one(X)[True]
-            if p > curr_p:
-                curr_action = a
-                curr_p = p
+        logits = yield (self.logits_many, (len(view.hand_lengths), feature_matrix(view, actions[1:])))
+        p = [sigmoid(z) for z in logits.tolist()] # a handful of actions is faster as floats
+        return actions[1 + p.index(max(p))] # first best action in the shuffled order
+
+    def logits_many(self, requests):
+        """
+            The logits of every (n, feature matrix) request, scored with one matrix product per number of players n.
+        """
+        if len(requests) == 1: # get_action's single request, no need to group and concatenate
+            n, X = requests[0]
+            w, intercept = self.weights(n)
+            return [X @ w + intercept]
+        logits = [None] * len(requests)
+        for n in {n for n, _ in requests}:
+            idx = [i for i, (m, _) in enumerate(requests) if m == n]
+            w, intercept = self.weights(n)
+            X = [requests[i][1] for i in idx]
+            z = np.concatenate(X) @ w + intercept
+            start = 0
+            for i, x in zip(idx, X):
+                logits[i] = z[start:start + len(x)]
+                start += len(x)
+        return logits
 
-        return curr_action
+    def weights(self, n):
+        """
+            Exports the river model's weights in the column order of feature_layout(n).
+            The export is cached until the model learns again.
+        """
+        if self.batch_size:
+            trainer = self.batch_trainer(n)
+            return trainer.w, trainer.intercept
+        if self._weights is None or self._weights[0] != n:
+            model_weights = self.model.weights
+            w = np.array([model_weights.get(k, 0.0) for k in feature_layout(n)], dtype=float)
+            self._weights = (n, w, float(self.model.intercept))
+        return self._weights[1], self._weights[2]
 
     def learn(self, X, Y):
         self.model.learn_one(X, Y)
+        self._weights = None
+
+    def use_batch_training(self, batch_size=256, every_round=True):
+        """
+            Switches to mini-batch training with a BatchTrainer started from the river model's weights.
+            With every_round, a step is taken at the end of every round, otherwise only when batch_size rows are buffered.
+        """
+        self.batch_size = batch_size
+        self.every_round = every_round
+        self.trainer = None # built on first use, once the number of players is known
+
+    def batch_trainer(self, n):
+        if self.trainer is None:
+            self.trainer = BatchTrainer.from_river(self.model, feature_layout(n), self.batch_size)
+        return self.trainer
+
+    def features(self, view, a):
+        """
+            The features ParamAgent stores for its decisions: a feature row when training in mini-batches,
+            and the feature dict of X otherwise.
+        """
+        if self.batch_size:
+            return feature_matrix(view, [a])[0]
+        return self.X(view, a)
+
+    def learn_round(self, rows, Y):
+        """
+            Learns that every stored decision of a round got the outcome Y.
+        """
+        if not self.batch_size:
+            for X in rows:
+                self.learn(X, Y)
+            return
+
+        rows = np.array(rows)
+        trainer = self.batch_trainer((rows.shape[1] - len(FEATURES) - 7) // 2)
+        trainer.learn_many(rows, Y)
+        if self.every_round:
+            trainer.step()
+
+    def export_weights(self):
+        """
+            Copies the mini-batch weights into the river model, so it can be used or pickled without the trainer.
+        """
+        if self.trainer is not None:
+            self.trainer.to_river(self.model)
+            self._weights = None
+
+    def __getstate__(self):
+        self.export_weights() # keep pickled models usable by the river code path
+        return self.__dict__
 
 
 
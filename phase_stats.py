@@ -0,0 +1,104 @@
+"""
+    This file implements PhaseStats, the timers and counters ScumController keeps when
+    controller.enable_stats() is called.
+
+    Phases are timed with time.perf_counter and accumulated as total time and number of calls:
+        setup_round: dealing and trading
+        AgentView: pointing the shared view at the player to act
+        get_action[i]: the get_action call of agent i
+        play: applying the action to the gamestate
+        trick_end: checking for the end of the round or of the trick, and moving to the next player
+        finish_round: the agents' end of round learning, and writing experience / game records
+    and counters are kept of rounds, turns, passes, auto-passes (passes of players who had no legal play)
+    and tricks (times every player passed and the table was cleared).
+"""
+import time
+from collections import Counter
+
+clock = time.perf_counter
+
+COUNTERS = ["rounds", "turns", "passes", "auto_passes", "tricks"]
+
+
+def agent_label(agent):
+    """
+        A readable name for an agent: its class, and its action function if it has a plain one.
+    """
+    label = type(agent).__name__
+    f = getattr(agent, "action_function", None)
+    name = getattr(f, "__name__", None)
+    if name and name != "action_function":
+        label += f"({name})"
+    return label
+
+
+class PhaseStats:
+    def __init__(self, agents):
+        """
+            Initialize empty stats for a game between agents.
+        """
+        self.agents = [agent_label(agent) for agent in agents]
+        self.action_phases = [f"get_action[{i}]" for i in range(len(agents))] # so turns don't format strings
+        self.reset()
+
+    def reset(self):
+        self.time = Counter()
+        self.calls = Counter()
+        self.counts = Counter()
+        self.round_turns = [] # number of turns of every round
+
+    def lap(self, phase, start):
+        """
+            Adds the time since start to phase, and returns the current time so the next phase can start from it.
+        """
+        now = clock()
+        self.time[phase] += now - start
+        self.calls[phase] += 1
+        return now
+
+    def count(self, counter, n=1):
+        self.counts[counter] += n
+
+    def end_round(self, turns):
+        self.counts["rounds"] += 1
+        self.round_turns.append(turns)
+
+    def snapshot(self):
+        """
+            The stats so far as plain dicts and lists, ready to be printed or saved as JSON.
+        """
+        phases = {}
+        for phase, total in self.time.items():
+            calls = self.calls[phase]
+            phases[phase] = {"calls" : calls, "total_s" : total, "mean_us" : total / calls * 1e6}
+        turns = self.round_turns
+        return {
+            "agents" : list(self.agents),
+            "phases" : phases,
+            "counters" : {counter : self.counts[counter] for counter in COUNTERS},
+            "turns_per_round" : {
+                "min" : min(turns) if turns else 0,
+                "mean" : sum(turns) / len(turns) if turns else 0,
+                "max" : max(turns) if turns else 0,
+            },
+        }
+
+    def report(self):
+        """
+            The snapshot as a table, with the phases from slowest to fastest in total.
+        """
+        snap = self.snapshot()
+        total = sum(phase["total_s"] for phase in snap["phases"].values()) or 1
+        rows = []
+        for name, phase in sorted(snap["phases"].items(), key=lambda item: -item[1]["total_s"]):
+            if name.startswith("get_action["):
+                name += " " + self.agents[int(name[11:-1])]
+            rows.append((name, phase))
+        width = max([len(name) for name, _ in rows] + [5]) + 2
+        lines = [f"{'phase':<{width}}{'calls':>10}{'total s':>10}{'mean us':>10}{'share':>8}"]
+        for name, phase in rows:
+            lines.append(f"{name:<{width}}{phase['calls']:>10}{phase['total_s']:>10.3f}{phase['mean_us']:>10.1f}{phase['total_s'] / total:>8.1%}")
+        lines.append(", ".join(f"{counter}: {n}" for counter, n in snap["counters"].items()))
+        tpr = snap["turns_per_round"]
+        lines.append(f"turns per round: min {tpr['min']}, mean {tpr['mean']:.1f}, max {tpr['max']}")
+        return "\n".join(lines)
@@ -2,8 +2,9 @@ from random import randint
 import numpy as np
 import pickle
 
-from numpy.core.numeric import Inf
 from State import SimpleView, int_state, int_action_space, int_to_action
+from qtable import QTable
+from q_train import OfflineTrainer
 from os.path import exists
 
 
@@ -12,52 +13,98 @@ class QLearning():
         A Q-Learning object is generated in order to initialize Q,
         the data it builds Q from, and the number of episodes used
         to generate Q.
+        Q is stored as a QTable of the given dtype ("float64", "float32" or "float16").
     """
-    def __init__(self, episodes=100):
-        self.Q = np.zeros((500000, 14))
+    def __init__(self, episodes=100, dtype="float32"):
+        self.dtype = dtype
+        self.Q = QTable(dtype)
         # self.data = pickle.load(open("Q/randbase_backprop_100000.p", "rb"))
         self.num_episodes = episodes
 
     def q_learn(self, round_data, reward):
+        if not self.Q.writeable: # tables mapped read-only are for evaluation, and are never updated
+            return
+        Q, rows = self.Q.Q, self.Q.rows # index the table's rows directly, this runs after every round
         for i in range(len(round_data) - 2, -1, -1):
             s, a = round_data[i]
-            sp = round_data[i + 1][0]
-            self.Q[s, a] = self.Q[s, a] + 0.1*(reward + 0.95 * self.Q[sp, a] - self.Q[s, a])
+            s, sp = rows[s], rows[round_data[i + 1][0]]
+            Q[s, a] = Q[s, a] + 0.1*(reward + 0.95 * Q[sp, a] - Q[s, a])
 
     def load_q(self):
         """
             Builds up Q from the reversed data. It repeats this process for num_episodes.
         """
-        if exists("Q/best_randbase_backprop_100000_6.p"):
+        if exists("Q/best_randbase_backprop_100000_6.qt"):
+            print("Mapping big Q table...")
+            self.load_table("Q/best_randbase_backprop_100000_6.qt")
+        elif exists("Q/best_randbase_backprop_100000_6.p"):
             print("Loading big Q pickle...")
-            self.Q = pickle.load(open("Q/best_randbase_backprop_100000_6.p", "rb"))
+            self.Q = self.as_table(pickle.load(open("Q/best_randbase_backprop_100000_6.p", "rb")))
+        elif exists("Q/randbase_backprop_100000.qt"):
+            print("Mapping Q table...")
+            self.load_table("Q/randbase_backprop_100000.qt")
         elif exists(r"Q\randbase_backprop_100000.p"):
             print("Loading Q pickle...")
-            self.Q = pickle.load(open(r"Q\randbase_backprop_100000.p", "rb"))
+            self.Q = self.as_table(pickle.load(open(r"Q\randbase_backprop_100000.p", "rb")))
         else:
-            for i in range(self.num_episodes):
-                print("On episode", i+1)
-                for state, action, reward, state_prime in reversed(self.data):
-                    self.Q[state, action] = self.Q[state, action] + 0.1*(reward + 0.95 * self.Q[state_prime, action] - self.Q[state, action])
-            
-            pickle.dump(self.Q, open(r"Q\randbase_backprop_100000.p", "wb"))
+            self.train_offline(self.data)
+            self.save_table("Q/randbase_backprop_100000.qt") # mapped by the next start instead of retrained
+
+    def train_offline(self, data, episodes=None):
+        """
+            Runs the backwards Q-learning sweep over data (a list of (s, a, r, sp) tuples,
+            or an OfflineTrainer) for episodes episodes (num_episodes by default).
+        """
+        trainer = data if isinstance(data, OfflineTrainer) else OfflineTrainer.from_tuples(data)
+        trainer.train(self.Q, self.num_episodes if episodes is None else episodes)
+
+    def load_table(self, path, mode="c"):
+        """
+            Memory-maps a Q table saved with QTable.save. By default updates are copy-on-write,
+            so the file and every other process mapping it keep the saved values.
+            Use mode="r" for evaluators that should never update Q.
+        """
+        self.Q = QTable.open(path, mode)
+
+    def save_table(self, path):
+        self.Q.save(path)
+
+    def as_table(self, Q):
+        """
+            Old pickles hold a dense Q array, convert those to a QTable.
+        """
+        if isinstance(Q, np.ndarray):
+            return QTable.from_dense(Q, self.dtype)
+        return Q
 
     def optimal_policy(self, state, actions):
         """
             Returns the action with the maximum expected utility based on Q
             and the available actions.
         """
-        
-        pairs = [(i, x) for i, x in enumerate(self.Q[state]) if i in actions and i != 0]
-        max_index = 0
-        max_val = float(-Inf)
-        for i, x in pairs:
-            if x > max_val:
-                max_index = i
-                max_val = x
+        legal = np.zeros((1, 14), dtype=bool)
+        legal[0, actions] = True
+        return int(self.optimal_policies(np.array([state]), legal)[0])
 
+    def optimal_policies(self, states, legal):
+        """
+            Batched optimal_policy: given an array of k states and a (k x 14) boolean mask of
+            their legal actions, returns the best non-pass legal action of every state
+            (the first one on ties), or 0 (pass) when no other action is legal.
+        """
+        values = np.where(legal, self.Q[states], -np.inf)
+        values[:, 0] = -np.inf # passing is only chosen when nothing else is legal
+        return values.argmax(axis=1)
+
+    def optimal_policy_many(self, requests):
+        """
+            optimal_policy of every (state, actions) pair in requests, with a single lookup in Q.
+        """
+        states = np.array([state for state, _ in requests])
+        legal = np.zeros((len(requests), 14), dtype=bool)
+        for i, (_, actions) in enumerate(requests):
+            legal[i, actions] = True
+        return self.optimal_policies(states, legal).tolist()
 
-        return max_index
-    
     def get_q(self):
         return self.Q
\ No newline at end of file
@@ -0,0 +1,105 @@
+"""
+    This file implements offline Q-learning over stored experience.
+
+    QLearning.load_q replays the data backwards, one (state, action, reward, state_prime) tuple at a time:
+        Q[s, a] += alpha * (r + gamma * Q[sp, a] - Q[s, a])
+    Later updates can read values that earlier updates wrote, so the sweep can't be done as one big
+    array operation. Instead, every update is given a level: one more than the last update that wrote
+    either of the Q values it uses, and no lower than the last update that read the value it writes.
+    All updates of a level only read values final for that level and write distinct values, so each
+    level is applied as one gather / scatter, and the result is the same as the sequential sweep.
+    The levels only depend on the data, so they are computed once and reused for every episode.
+"""
+import pickle
+import time
+import numpy as np
+from qtable import N_ACTIONS
+from experience import ExperienceReader
+
+
+class OfflineTrainer:
+    def __init__(self, states, actions, rewards, state_primes, alpha=0.1, gamma=0.95):
+        """
+            Initialize with columnar experience, in the order it was collected.
+        """
+        self.states = np.asarray(states, dtype=np.int64)
+        self.actions = np.asarray(actions, dtype=np.int64)
+        self.rewards = np.asarray(rewards, dtype=np.float64)
+        self.state_primes = np.asarray(state_primes, dtype=np.int64)
+        self.alpha = alpha
+        self.gamma = gamma
+        self.levels = None
+
+    @classmethod
+    def from_tuples(cls, data, **kwargs):
+        """
+            Builds a trainer from a list of (s, a, r, sp) tuples, as collected by DataCollectingAgent.
+        """
+        if not data:
+            return cls([], [], [], [], **kwargs)
+        s, a, r, sp = zip(*data)
+        return cls(s, a, r, sp, **kwargs)
+
+    @classmethod
+    def from_pickle(cls, path, **kwargs):
+        with open(path, "rb") as f:
+            return cls.from_tuples(pickle.load(f), **kwargs)
+
+    @classmethod
+    def from_log(cls, path, **kwargs):
+        """
+            Builds a trainer from an experience log written by ExperienceWriter.
+        """
+        return cls(*ExperienceReader(path).columns(), **kwargs)
+
+    def __len__(self):
+        return len(self.states)
+
+    def schedule(self):
+        """
+            Splits the backwards sweep into levels of updates that can be applied together.
+            Returns the list of index arrays (into the experience) of every level, in order.
+        """
+        if self.levels is not None:
+            return self.levels
+
+        n = len(self)
+        writes = (self.states * N_ACTIONS + self.actions)[::-1].tolist()
+        reads = (self.state_primes * N_ACTIONS + self.actions)[::-1].tolist()
+        last_write = {}
+        last_read = {}
+        level = [0] * n
+        for i in range(n):
+            w, r = writes[i], reads[i]
+            lvl = max(last_write.get(w, -1) + 1, last_write.get(r, -1) + 1, last_read.get(w, 0))
+            level[i] = lvl
+            last_write[w] = lvl
+            if lvl > last_read.get(r, -1):
+                last_read[r] = lvl
+
+        level = np.array(level, dtype=np.int64)
+        order = np.argsort(level, kind="stable")
+        bounds = np.cumsum(np.bincount(level))
+        sweep = np.arange(n - 1, -1, -1)[order] # back from sweep positions to experience indices
+        self.levels = np.split(sweep, bounds[:-1])
+        return self.levels
+
+    def train(self, table, episodes, verbose=True):
+        """
+            Runs episodes backwards sweeps of Q-learning updates on table (a QTable).
+        """
+        levels = self.schedule()
+        Q = table.Q.reshape(-1) # flat view, so every update is one index
+        writes = table.rows[self.states] * N_ACTIONS + self.actions
+        reads = table.rows[self.state_primes] * N_ACTIONS + self.actions
+        chunks = [(writes[idx], reads[idx], self.rewards[idx]) for idx in levels]
+
+        for e in range(episodes):
+            t = time.time()
+            for w, r, reward in chunks:
+                q = Q[w].astype(np.float64)
+                Q[w] = q + self.alpha * (reward + self.gamma * Q[r] - q)
+            if verbose:
+                dt = max(time.time() - t, 1e-9)
+                print(f"Episode {e + 1}/{episodes}: {len(self)} updates in {len(chunks)} chunks, {dt:.2f}s ({len(self) / dt:.0f} updates/s)", flush=True)
+        return table
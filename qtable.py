@@ -0,0 +1,177 @@
+"""
+    This file implements QTable, a compact store for the Q values of QLearning.
+
+    int_state can only produce states made of a hand of at most 5 ranks and one of 53 top card codes,
+    and not every pair is possible (there are only 4 cards of each rank between the hand and the top cards).
+    Instead of one row for every integer below 500000, a QTable keeps one row per reachable state,
+    and maps states to rows with a lookup array that every QTable in the process shares.
+
+    A QTable is indexed exactly like the old dense array: Q[s, a], Q[s] and arrays of states all work.
+
+    Tables are saved as a 64 byte header followed by the raw rows, so they can be opened with np.memmap
+    without a load step. A table opened read-only is shared page for page by every process that maps it,
+    and is pickled by path, so sending it to a worker process does not copy it.
+"""
+import struct
+import numpy as np
+from State import N_HANDS, index_hand
+
+N_ACTIONS = 14
+N_TOP = 56 # the top cards take the lowest 56 values of an int_state (see int_state)
+N_STATES = N_TOP * N_HANDS
+DTYPES = {"float64" : np.float64, "float32" : np.float32, "float16" : np.float16}
+
+# file header: magic, format version, state encoding id, dtype name, rows, columns
+MAGIC = b"SCUMQTBL"
+VERSION = 1
+ENCODING = b"int_state.rows1" # int_state numbering, with the reachable state row mapping of state_rows
+HEADER = struct.Struct("<8sH16s8sII")
+HEADER_SIZE = 64 # the rows start 64 bytes in, so they stay aligned
+
+_rows = None
+
+
+def state_rows():
+    """
+        Returns the array mapping every int_state to its row in a QTable.
+        Unreachable states all map to the last row, which is never used by a reachable state.
+    """
+    global _rows
+    if _rows is None:
+        counts = np.zeros((N_HANDS, 13), dtype=np.int64)
+        for h in range(N_HANDS):
+            for rank in index_hand(h):
+                counts[h, rank - 2] += 1
+
+        top = np.arange(N_TOP)
+        top_rank = top % 14 # rank - 1 of the top cards, 0 only when there are no top cards
+        top_count = top // 14 + 1
+        held = counts[:, np.maximum(top_rank - 1, 0)] # cards of the top rank still in the hand
+        valid_top = (top == 0) | (top_rank > 0)
+        reachable = (counts <= 4).all(axis=1)[:, None] & valid_top[None, :] & ((top == 0) | (held + top_count <= 4))
+
+        reachable = reachable.ravel() # state s = top + 56 * hand, so the flattened index is the state
+        rows = np.full(N_STATES, reachable.sum(), dtype=np.int32)
+        rows[reachable] = np.arange(reachable.sum(), dtype=np.int32)
+        _rows = rows
+    return _rows
+
+
+class QTable:
+    def __init__(self, dtype="float32"):
+        """
+            Initialize an all zero table. dtype is one of "float64", "float32" or "float16".
+        """
+        self.rows = state_rows()
+        self.Q = np.zeros((self.rows.max() + 1, N_ACTIONS), dtype=DTYPES[dtype])
+        self.path = None # set when the table is memory-mapped from a file
+        self.mode = None
+
+    @classmethod
+    def from_dense(cls, dense, dtype="float32"):
+        """
+            Builds a QTable from an old dense (500000 x 14) Q array.
+        """
+        table = cls(dtype)
+        reachable = np.flatnonzero(table.rows < len(table.Q) - 1)
+        table.Q[table.rows[reachable]] = dense[reachable]
+        return table
+
+    @classmethod
+    def open(cls, path, mode="r"):
+        """
+            Memory-maps a saved table. mode is passed to np.memmap:
+            "r" is read-only and shared between processes, "c" is copy-on-write (updates stay private
+            to this process) and "r+" writes updates back to the file.
+        """
+        dtype, n_rows = read_header(path)
+        table = cls.__new__(cls)
+        table.rows = state_rows()
+        if n_rows != table.rows.max() + 1:
+            raise ValueError(f"Q table {path} has {n_rows} rows, expected {table.rows.max() + 1}")
+        file_dtype = np.dtype(DTYPES[dtype]).newbyteorder("<") # tables are always saved little-endian
+        table.Q = np.memmap(path, dtype=file_dtype, mode=mode, offset=HEADER_SIZE, shape=(n_rows, N_ACTIONS))
+        table.path = path
+        table.mode = mode
+        return table
+
+    def save(self, path):
+        """
+            Writes the table to path in the format read by QTable.open.
+        """
+        dtype = self.Q.dtype.name
+        header = HEADER.pack(MAGIC, VERSION, ENCODING, dtype.encode(), len(self.Q), N_ACTIONS)
+        with open(path, "wb") as f:
+            f.write(header.ljust(HEADER_SIZE, b"\0"))
+            f.write(np.ascontiguousarray(self.Q, dtype=self.Q.dtype.newbyteorder("<")).tobytes())
+
+    def to_dense(self):
+        """
+            Expands the table back into a dense (states x 14) float64 array.
+        """
+        dense = self.Q[self.rows].astype(np.float64)
+        dense[self.rows == len(self.Q) - 1] = 0
+        return dense
+
+    @property
+    def shape(self):
+        return (N_STATES, N_ACTIONS)
+
+    @property
+    def dtype(self):
+        return self.Q.dtype
+
+    @property
+    def nbytes(self):
+        return self.Q.nbytes
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            s, a = key
+            return self.Q[self.rows[s], a]
+        return self.Q[self.rows[key]]
+
+    def __setitem__(self, key, value):
+        if isinstance(key, tuple):
+            s, a = key
+            self.Q[self.rows[s], a] = value
+        else:
+            self.Q[self.rows[key]] = value
+
+    @property
+    def writeable(self):
+        return self.Q.flags.writeable
+
+    def __getstate__(self):
+        # the row mapping is rebuilt on load rather than pickled with every table
+        if self.mode == "r":
+            return {"path" : self.path} # read-only tables are reopened from their file rather than copied
+        return {"Q" : np.asarray(self.Q)}
+
+    def __setstate__(self, state):
+        if "path" in state:
+            self.__dict__.update(QTable.open(state["path"], "r").__dict__)
+            return
+        self.Q = state["Q"]
+        self.rows = state_rows()
+        self.path = None
+        self.mode = None
+
+
+def read_header(path):
+    """
+        Reads and checks the header of a saved table, returning its dtype name and number of rows.
+    """
+    with open(path, "rb") as f:
+        magic, version, encoding, dtype, n_rows, n_cols = HEADER.unpack(f.read(HEADER.size))
+    encoding = encoding.rstrip(b"\0")
+    dtype = dtype.rstrip(b"\0").decode()
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a saved Q table")
+    if version != VERSION:
+        raise ValueError(f"Q table {path} has format version {version}, expected {VERSION}")
+    if encoding != ENCODING:
+        raise ValueError(f"Q table {path} uses state encoding {encoding.decode()}, expected {ENCODING.decode()}")
+    if dtype not in DTYPES or n_cols != N_ACTIONS:
+        raise ValueError(f"Q table {path} has unsupported dtype {dtype} or {n_cols} actions")
+    return dtype, n_rows
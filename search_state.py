@@ -0,0 +1,252 @@
+"""
+    This file implements SearchState, a copy of a round in progress that search agents can play
+    forward and take back without touching the live table.
+
+    Hands are 52-bit masks (as Hand.mask), and the top cards, passes and outs are ints and bitmasks,
+    so a SearchState is built from a gamestate in O(n). apply plays an action with the same rules as
+    ScumController, and pushes what it changed on an undo stack: undo takes the last action back in
+    constant time, and snapshot / restore mark a point and rewind to it, so a rollout never copies the state.
+
+    Actions are card masks, 0 being a pass. From a view, from_view deals the cards the player can't see
+    at random to the other players, so search agents only use what they know.
+"""
+import random
+from Cards import CARDS, Hand
+from State import SimpleView
+
+
+def mask_cards(mask):
+    """
+        The cards of a mask, from lowest to highest.
+    """
+    cards = []
+    while mask:
+        low = mask & -mask
+        cards.append(CARDS[low.bit_length() - 1])
+        mask ^= low
+    return cards
+
+
+def cards_mask(cards):
+    mask = 0
+    for card in cards:
+        mask |= 1 << card.index
+    return mask
+
+
+class SearchState:
+    __slots__ = ("n", "hands", "out", "out_mask", "top_mask", "top_rank", "top_count", "passed", "last_player", "curr_player", "history")
+
+    def __init__(self, hands, out, top_cards, passed, last_player, curr_player):
+        """
+            A round where hands are the players' card masks, out is the list of players out in order,
+            top_cards the cards on the table, passed the list of who passed this trick, and curr_player is to act.
+        """
+        self.n = len(hands)
+        self.hands = list(hands)
+        self.out = list(out)
+        self.out_mask = 0
+        for p in out:
+            self.out_mask |= 1 << p
+        self.top_mask = cards_mask(top_cards)
+        self.top_rank = (top_cards[0].index >> 2) if top_cards else -1
+        self.top_count = len(top_cards)
+        self.passed = 0
+        for p, has_passed in enumerate(passed):
+            if has_passed:
+                self.passed |= 1 << p
+        self.last_player = last_player
+        self.curr_player = curr_player
+        self.history = [] # undo records of the applied actions
+
+    @classmethod
+    def from_gamestate(cls, gamestate, curr_player):
+        """
+            A copy of the round of gamestate, with every hand known.
+        """
+        return cls([hand.mask for hand in gamestate.hands], gamestate.out, gamestate.top_cards, gamestate.passed, gamestate.last_player, curr_player)
+
+    @classmethod
+    def from_controller(cls, controller):
+        return cls.from_gamestate(controller.gamestate, controller.curr_player)
+
+    @classmethod
+    def from_view(cls, view, rng=random):
+        """
+            A round consistent with what the player of view knows, for that player to act:
+            the cards neither in their hand nor played yet are dealt at random to the other players,
+            according to their hand lengths.
+        """
+        player = view.player
+        unseen = mask_cards(view.cards_seen.unseen_mask(view.hand))
+        rng.shuffle(unseen)
+        hands = []
+        start = 0
+        for p, length in enumerate(view.hand_lengths):
+            if p == player:
+                hands.append(view.hand.mask)
+            else:
+                hands.append(cards_mask(unseen[start:start + length]))
+                start += length
+        if start != len(unseen):
+            raise ValueError(f"The hand lengths of the view hold {start} unseen cards, but {len(unseen)} are unseen")
+        return cls(hands, view.out, view.top_cards, view.passed, view.last_player, player)
+
+    def over(self):
+        return len(self.out) == self.n
+
+    def legal_actions(self):
+        """
+            The action masks of the current player's int_action_space: a pass, and for every rank that can be played,
+            all its cards on an empty table, or as many of its lowest cards as the top cards (as int_to_action plays them).
+        """
+        hand = self.hands[self.curr_player]
+        actions = [0]
+        for r in range(self.top_rank + 1, 13):
+            suits = (hand >> (r << 2)) & 0xF
+            if not suits:
+                continue
+            if self.top_count:
+                for _ in range(self.top_count - 1):
+                    suits &= suits - 1 # drop the lowest suit, to find how many there are
+                if not suits:
+                    continue
+                low = suits & -suits # the top_count-th lowest card
+                suits = ((hand >> (r << 2)) & 0xF) & ((low << 1) - 1)
+            actions.append(suits << (r << 2))
+        return actions
+
+    def view(self):
+        """
+            A SimpleView of the current player, for action functions that take views (like baseline_action).
+        """
+        hand = Hand()
+        hand.set_cards(mask_cards(self.hands[self.curr_player]))
+        return SimpleView(hand, mask_cards(self.top_mask))
+
+    def int_action(self, a):
+        """
+            The action mask of int action a (as int_to_action) for the current player.
+        """
+        if not a:
+            return 0
+        r = a - 1
+        suits = (self.hands[self.curr_player] >> (r << 2)) & 0xF
+        if self.top_count:
+            kept = 0
+            for _ in range(self.top_count):
+                low = suits & -suits
+                kept |= low
+                suits ^= low
+            suits = kept
+        return suits << (r << 2)
+
+    def apply(self, action):
+        """
+            Plays action (a card mask, 0 to pass) for the current player and moves to the next turn, as
+            ScumController.advance does. Returns the out order when the round is over, and None otherwise.
+        """
+        p = self.curr_player
+        self.history.append((p, action, self.top_mask, self.top_rank, self.top_count, self.passed, self.last_player, self.out_mask, len(self.out)))
+        if action:
+            if action & ~self.hands[p]:
+                raise ValueError(f"Action {mask_cards(action)} attempted to play cards not in hand")
+            rank = (action.bit_length() - 1) >> 2
+            if action & ((1 << (rank << 2)) - 1): # cards below the highest card's rank
+                raise ValueError(f"Action {mask_cards(action)} is not a set")
+            if rank <= self.top_rank:
+                raise ValueError(f"Action {mask_cards(action)} does not beat top cards {mask_cards(self.top_mask)}")
+            self.top_mask = action
+            self.top_rank = rank
+            self.top_count = bin(action).count("1")
+            self.last_player = p
+            self.hands[p] ^= action
+            if not self.hands[p]:
+                self.out.append(p)
+                self.out_mask |= 1 << p
+        self.passed |= 1 << p # every player who takes a turn has passed, as in ScumController.play
+
+        n = self.n
+        if len(self.out) >= n - 1: # all but 1 players are out
+            remaining = ((1 << n) - 1) & ~self.out_mask
+            last = remaining.bit_length() - 1
+            self.out.append(last)
+            self.out_mask |= 1 << last
+            return self.out
+
+        if (self.passed | self.out_mask) == (1 << n) - 1: # everyone has passed or is out, clear the table
+            self.passed = 0
+            if not self.out_mask >> self.last_player & 1:
+                self.curr_player = self.last_player
+            else:
+                while self.out_mask >> self.curr_player & 1:
+                    self.curr_player = (self.curr_player + 1) % n
+            self.top_mask = 0
+            self.top_rank = -1
+            self.top_count = 0
+        elif not self.top_count: # on an empty table out players still get a turn
+            self.curr_player = (p + 1) % n
+        else: # out players facing cards always pass, so skip them, marking them as passed
+            q = (p + 1) % n
+            while self.out_mask >> q & 1:
+                self.passed |= 1 << q
+                q = (q + 1) % n
+            self.curr_player = q
+        return None
+
+    def undo(self):
+        """
+            Takes back the last applied action.
+        """
+        p, action, self.top_mask, self.top_rank, self.top_count, self.passed, self.last_player, self.out_mask, n_out = self.history.pop()
+        self.hands[p] |= action
+        del self.out[n_out:]
+        self.curr_player = p
+
+    def snapshot(self):
+        """
+            A mark of the current state, which restore can rewind to.
+        """
+        return len(self.history)
+
+    def restore(self, mark):
+        while len(self.history) > mark:
+            self.undo()
+
+
+def baseline_policy(state):
+    """
+        baseline_action on a SearchState: plays the lowest legal rank, or passes.
+    """
+    actions = state.legal_actions()
+    return actions[1] if len(actions) > 1 else 0
+
+
+def random_policy(state, rng=random):
+    """
+        random_action on a SearchState: a uniformly random legal action, including a pass.
+    """
+    return rng.choice(state.legal_actions())
+
+
+def view_policy(action_function):
+    """
+        Wraps an action function that takes a view and returns an int action (like heuristic_action) as a SearchState policy.
+    """
+    def policy(state):
+        return state.int_action(action_function(state.view()))
+    return policy
+
+
+def rollout(state, policy):
+    """
+        Plays the round out from state with every player following policy, and returns the out order.
+        The state is rewound to where it started.
+    """
+    mark = state.snapshot()
+    scores = None
+    while scores is None:
+        scores = state.apply(policy(state))
+    scores = list(scores)
+    state.restore(mark)
+    return scores
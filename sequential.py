@@ -0,0 +1,100 @@
+"""
+    This file implements the running statistics used to stop a tournament early.
+
+    After every batch of games, each agent's average placement in the batch is one sample.
+    Means and variances are updated incrementally (Welford's method), for every agent and for the
+    difference of every pair of agents, which is much less noisy than either agent alone since both play the same games.
+
+    The ranking is settled when, for every two agents next to each other in the ranking, the confidence
+    interval of their mean difference excludes 0. The intervals are checked after every batch, and each
+    check covers the n_agents - 1 adjacent pairs, so to keep the chance of ever stopping on a wrong ranking
+    below 1 - level, the tth check uses the level 1 - (1 - level) / (t (t + 1) (n_agents - 1)) for every pair:
+    the error rates add up to at most 1 - level over any number of checks and all the pairs (a Bonferroni correction).
+"""
+import math
+from statistics import NormalDist
+
+
+class RunningMean:
+    def __init__(self):
+        """
+            An empty sample, updated one value at a time.
+        """
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0 # sum of squared distances from the mean
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else math.inf
+
+    def half_width(self, z):
+        """
+            Half the width of the normal confidence interval of the mean with critical value z.
+        """
+        return z * math.sqrt(self.variance() / self.n) if self.n > 1 else math.inf
+
+
+def sequential_z(t, level, n_intervals=1):
+    """
+        The critical value of each of n_intervals intervals at the tth check of a sequence of checks, see the file docstring.
+    """
+    alpha = (1 - level) / (t * (t + 1) * n_intervals)
+    return NormalDist().inv_cdf(1 - alpha / 2)
+
+
+class RankingMonitor:
+    def __init__(self, n_agents, level=0.95, min_batches=10):
+        """
+            Tracks the placements of n_agents agents over batches, and whether their ranking is settled.
+            The ranking is never settled before min_batches batches: with fewer, the estimated variances
+            are too noisy for the normal intervals, and a few lucky batches could stop it.
+        """
+        self.n_agents = n_agents
+        self.level = level
+        self.min_batches = min_batches
+        self.batches = 0
+        self.agents = [RunningMean() for _ in range(n_agents)]
+        self.pairs = {(i, j) : RunningMean() for i in range(n_agents) for j in range(i + 1, n_agents)} # placement of i minus placement of j
+
+    def add(self, placements):
+        """
+            Adds a batch, given as the average placement of every agent in it.
+        """
+        self.batches += 1
+        for stats, placement in zip(self.agents, placements):
+            stats.add(placement)
+        for (i, j), stats in self.pairs.items():
+            stats.add(placements[i] - placements[j])
+
+    def means(self):
+        return [stats.mean for stats in self.agents]
+
+    def ranking(self):
+        """
+            The agents from best (lowest mean placement) to worst.
+        """
+        return sorted(range(self.n_agents), key=lambda k: self.agents[k].mean)
+
+    def unsettled(self):
+        """
+            The pairs of agents next to each other in the ranking whose order isn't settled yet,
+            with the mean and half width of their difference.
+        """
+        z = sequential_z(self.batches, self.level, max(self.n_agents - 1, 1)) if self.batches else math.inf
+        ranking = self.ranking()
+        pairs = []
+        for a, b in zip(ranking, ranking[1:]):
+            stats = self.pairs[min(a, b), max(a, b)]
+            half = stats.half_width(z)
+            if abs(stats.mean) <= half:
+                pairs.append((a, b, abs(stats.mean), half))
+        return pairs
+
+    def settled(self):
+        return self.batches >= self.min_batches and not self.unsettled()